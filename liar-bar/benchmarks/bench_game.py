@@ -0,0 +1,127 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import random
+
+import tools.tool as tools
+from conftest import SEED, play_random
+from game.honesty_table import probability_last_play_honest
+from game.simulation import DEFAULT_STYLES, new_game, play_game, run_compact_games
+from policies.cfr import CFRSolver
+from policies.personas import PERSONA_POLICIES
+from policies.search import SearchAgent
+
+
+def test_start_new_round(benchmark, game):
+    benchmark(game.start_new_round)
+
+
+def test_check_played_cards(benchmark, game):
+    cards = game.player_cards[game.current_player][:3]
+    assert benchmark(game.check_played_cards, cards)
+
+
+def test_check_played_cards_invalid(benchmark, game):
+    cards = ["J", "J"]
+    assert not benchmark(game.check_played_cards, cards)
+
+
+# 会修改游戏状态的操作每轮在一批新游戏上执行，减少计时误差
+BATCH = 100
+
+
+def test_play_trust(benchmark):
+    def setup():
+        games = [new_game(DEFAULT_STYLES, seed=SEED + i) for i in range(BATCH)]
+        return (games, [game.player_cards[game.current_player][:2] for game in games]), {}
+
+    def play(games, cards):
+        for game, played in zip(games, cards):
+            game.play(game.action_space[0], played)
+
+    benchmark.pedantic(play, setup=setup, rounds=100)
+
+
+def test_play_challenge(benchmark):
+    """质疑会结算惩罚、重新洗牌发牌并开始新的一轮"""
+    def setup():
+        return ([play_random(new_game(DEFAULT_STYLES, seed=SEED + i), 3) for i in range(BATCH)],), {}
+
+    def challenge(games):
+        for game in games:
+            game.play(game.action_space[1])
+
+    benchmark.pedantic(challenge, setup=setup, rounds=100)
+
+
+def test_get_game_logs_cached(benchmark, game_in_round):
+    game_in_round.get_game_logs(debug=True)
+    benchmark(game_in_round.get_game_logs, True)
+
+
+def test_get_game_logs_after_play(benchmark):
+    """页面每次重新运行前通常刚出过一次牌，缓存已经失效"""
+    def setup():
+        games = [play_random(new_game(DEFAULT_STYLES, seed=SEED + i), 6) for i in range(BATCH)]
+        for game in games:
+            game.get_game_logs(debug=True)
+            play_random(game, 1)
+        return (games,), {}
+
+    def render(games):
+        for game in games:
+            game.get_game_logs(debug=True)
+
+    benchmark.pedantic(render, setup=setup, rounds=100)
+
+
+def test_get_current_player_prompt(benchmark, game_in_round):
+    benchmark(game_in_round.get_current_player_prompt)
+
+
+def test_execute_divination(benchmark, game):
+    cards = game.player_cards[game.current_player]
+    rng = random.Random(SEED)
+    benchmark(tools.execute_divination, cards, game.target_card, rng)
+
+
+def test_probability_last_play_honest(benchmark, game_in_round):
+    """查询上家出牌全部为目标牌的概率"""
+    assert benchmark(probability_last_play_honest, game_in_round) is not None
+
+
+def test_persona_policies(benchmark, game_in_round):
+    """五种角色的规则策略各决策一次"""
+    def decide():
+        for policy in PERSONA_POLICIES.values():
+            policy(game_in_round)
+
+    benchmark(decide)
+
+
+def test_search_agent(benchmark, game_in_round):
+    """搜索智能体固定采样100次做一次决策"""
+    agent = SearchAgent(time_budget=None, max_samples=100, seed=SEED)
+    benchmark(agent.advise, game_in_round)
+
+
+def test_cfr_iterations(benchmark):
+    """MCCFR 单进程迭代1000次"""
+    solver = CFRSolver()
+    benchmark(solver.run, 1000, SEED)
+
+
+def test_headless_game(benchmark, policies):
+    """不调用模型，用随机策略完整进行一局游戏"""
+    seeds = random.Random(SEED)
+
+    def run():
+        game = new_game(DEFAULT_STYLES, seed=seeds.getrandbits(64))
+        return play_game(game, policies)
+
+    benchmark(run)
+
+
+def test_headless_compact_game(benchmark):
+    """与 test_headless_game 相同，但在 CompactState 上进行，对比紧凑状态的模拟速度"""
+    seeds = random.Random(SEED)
+    benchmark(lambda: run_compact_games(1, seed=seeds.getrandbits(64)))
@@ -0,0 +1,55 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import random
+
+from conftest import SEED
+from game.decision_router import DecisionRouter
+from game.simulation import DEFAULT_STYLES, new_game
+
+MOVES = 50
+
+
+def _agent_game(seed, decision_router=None):
+    game = new_game(DEFAULT_STYLES, seed=seed)
+    game.decision_router = decision_router
+    game.model_configuration_name = "bench-mock"
+    game.initialize_agents()
+    game.initialize_players(DEFAULT_STYLES)
+    return game
+
+
+def test_player_think(benchmark, mock_model):
+    """一次决策的本地开销：构造提示词、格式化、流式解析、校验"""
+    game = _agent_game(SEED)
+    benchmark(game.think)
+
+
+def test_end_to_end_game(benchmark, mock_model):
+    """使用模拟模型连续进行 MOVES 次决策和出牌，一局结束后开始新的一局，
+    覆盖智能体调用和游戏引擎的全部流程；固定决策次数使每轮的工作量不受对局长短影响"""
+    seeds = random.Random(SEED)
+
+    def run():
+        game = _agent_game(seeds.getrandbits(64))
+        for _ in range(MOVES):
+            if game.is_over():
+                game = _agent_game(seeds.getrandbits(64))
+            game.play(*game.player_think())
+
+    benchmark.pedantic(run, rounds=20)
+
+
+def test_end_to_end_game_routed(benchmark, mock_model):
+    """与 test_end_to_end_game 相同，但简单的局面由决策路由在本地决策，包括需要开启的首次出牌和占卜师路由"""
+    seeds = random.Random(SEED)
+    router = DecisionRouter(route_first_play=True, route_divination=True, seed=SEED)
+
+    def run():
+        game = _agent_game(seeds.getrandbits(64), router)
+        for _ in range(MOVES):
+            if game.is_over():
+                game = _agent_game(seeds.getrandbits(64), router)
+            game.play(*game.player_think())
+
+    benchmark.pedantic(run, rounds=20)
+    assert router.saved_rate > 0
@@ -0,0 +1,42 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import argparse
+import glob
+import os
+import sys
+
+import pytest
+from pytest_benchmark.session import PerformanceRegression
+from pytest_benchmark.utils import get_machine_id
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# 与 pytest.ini 中的 --benchmark-storage 一致
+STORAGE = os.path.join(HERE, ".benchmarks")
+
+
+def has_baseline():
+    """本机（相同的系统、Python版本）是否已经保存过基线"""
+    return bool(glob.glob(os.path.join(STORAGE, get_machine_id(), "*_baseline.json")))
+
+
+def main(argv=None):
+    """运行基准测试并与本机最近保存的基线比较，最快一次的耗时变慢超过阈值时以非零状态退出，可以直接作为CI步骤。
+    本机还没有基线时只保存一份基线，不做比较。"""
+    parser = argparse.ArgumentParser(description="基准测试回归检查")
+    parser.add_argument("--threshold", default="25%", help="最快一次的耗时允许变慢的比例，默认25%%")
+    args, pytest_args = parser.parse_known_args(argv)
+    os.chdir(HERE)
+    if not has_baseline():
+        print(f"no baseline for {get_machine_id()}, saving one instead of comparing")
+        return pytest.main(["--benchmark-save=baseline"] + pytest_args)
+    # 不能同时保存结果：pytest-benchmark 在检查回归之前就会写入文件，变慢的结果会成为新的基线
+    options = ["--benchmark-compare", f"--benchmark-compare-fail=min:{args.threshold}"]
+    try:
+        return pytest.main(options + pytest_args)
+    except PerformanceRegression:
+        # 回归的详细信息已经在结果表格之后打印
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
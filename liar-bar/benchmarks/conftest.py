@@ -0,0 +1,47 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import os
+import sys
+
+import pytest
+
+# 与 streamlit 运行时一致，从 src 目录导入模块
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from game.simulation import DEFAULT_STYLES, new_game, random_policy  # noqa: E402
+
+SEED = 20240101
+
+
+def play_random(game, moves):
+    """用随机策略出牌，只出牌不质疑，保证对局停留在同一轮"""
+    for _ in range(moves):
+        cards = game.player_cards[game.current_player]
+        if not cards:
+            break
+        game.play(game.action_space[0], [cards[0]], "先出一张牌试探一下", "这张是目标牌")
+    return game
+
+
+@pytest.fixture
+def game():
+    """发好牌的新游戏，每次使用相同的种子"""
+    return new_game(DEFAULT_STYLES, seed=SEED)
+
+
+@pytest.fixture
+def game_in_round():
+    """本轮已经有若干次出牌的游戏，用于测试提示词和出牌记录"""
+    return play_random(new_game(DEFAULT_STYLES, seed=SEED), 6)
+
+
+@pytest.fixture(scope="session")
+def mock_model():
+    """不访问网络的模拟模型，零延迟、流式输出，只测量本地开销"""
+    from models.mock_model import init_mock_model
+    return init_mock_model("bench-mock", disable_saving=True, latency=0, stream=True, seed=SEED)
+
+
+@pytest.fixture
+def policies():
+    return {player: random_policy for player in new_game(DEFAULT_STYLES).players}
@@ -1,11 +1,26 @@
 # Copyright (c) 2024 King Jingxiang
 # See the LICENSE file for license rights and limitations (MIT).
-from typing import Optional, Union, Sequence
+import asyncio
+import contextlib
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Callable, Generator, Optional, Sequence, Tuple, Union
 
 from agentscope.message import Msg
 from agentscope.agents.agent import AgentBase
+from agentscope.models import ModelResponse
 from agentscope.parsers import ParserBase
 
+from agents.prompt_prefix import PromptPrefix, estimate_tokens
+from agents.response_cache import ResponseCache
+from agents.stream_parser import MarkdownJsonStreamParser
+from instrumentation import metrics
+
+
+class _ReplyAbandoned(Exception):
+    """Raised in the worker thread to stop a reply nobody waits for."""
+
 
 class DictDialogAgent(AgentBase):
     """An agent that generates response in a dict format, where user can
@@ -24,6 +39,7 @@ class DictDialogAgent(AgentBase):
             model_config_name: str,
             use_memory: bool = True,
             max_retries: Optional[int] = 3,
+            cache: Optional[ResponseCache] = None,
     ) -> None:
         """Initialize the dict dialog agent.
 
@@ -41,6 +57,8 @@ class DictDialogAgent(AgentBase):
             max_retries (`Optional[int]`, defaults to `None`):
                 The maximum number of retries when failed to parse the model
                 output.
+            cache (`Optional[ResponseCache]`, defaults to `None`):
+                The cache of raw model responses, disabled by default.
         """  # noqa
         super().__init__(
             name=name,
@@ -50,17 +68,34 @@ class DictDialogAgent(AgentBase):
         )
 
         self.parser = None
+        self.prompt_prefix = None
         self.max_retries = max_retries
+        self.cache = cache
 
     def set_parser(self, parser: ParserBase) -> None:
         """Set response parser, which will provide 1) format instruction; 2)
         response parsing; 3) filtering fields when returning message, storing
         message in memory. So developers only need to change the
         parser, and the agent will work as expected.
+
+        The system prompt and the format instruction are merged into a
+        stable prompt prefix which is reused by every call.
         """
         self.parser = parser
+        self.prompt_prefix = PromptPrefix(
+            {"system": self.sys_prompt, "format": parser.format_instruction},
+        )
 
-    def reply(self, x: Optional[Union[Msg, Sequence[Msg]]] = None) -> Msg:
+    def set_cache(self, cache: Optional[ResponseCache]) -> None:
+        """Set the response cache, `None` disables caching."""
+        self.cache = cache
+
+    def reply(
+            self,
+            x: Optional[Union[Msg, Sequence[Msg]]] = None,
+            use_cache: bool = True,
+            on_stream: Optional[Callable[[MarkdownJsonStreamParser], None]] = None,
+    ) -> Msg:
         """Reply function of the agent.
         Processes the input data, generates a prompt using the current
         dialogue memory and system prompt, and invokes the language
@@ -71,7 +106,17 @@ class DictDialogAgent(AgentBase):
             x (`Optional[Union[Msg, Sequence[Msg]]]`, defaults to `None`):
                 The input message(s) to the agent, which also can be omitted if
                 the agent doesn't need any input.
-
+            use_cache (`bool`, defaults to `True`):
+                Whether to look up the response cache. A fresh response is
+                always written back, so retries can bypass a bad entry.
+            on_stream (`Optional[Callable[[MarkdownJsonStreamParser], None]]`,
+            defaults to `None`):
+                Called with an incremental parser every time a new chunk of
+                a streamed response arrives, so partial fields can be shown
+                before the full response is generated. Cached and
+                non-streamed responses trigger a single call. An exception
+                raised by the callback aborts the generation and is
+                re-raised to the caller.
 
         Returns:
             `Msg`: The output message generated by the agent.
@@ -85,22 +130,87 @@ class DictDialogAgent(AgentBase):
         if self.memory:
             self.memory.add(x)
 
-        # prepare prompt
+        # prepare prompt, the stable prefix goes first and the volatile
+        # input last so the prefix can be cached by the provider
         prompt = self.model.format(
-            Msg("system", self.sys_prompt, role="system"),
-            self.memory
-            and self.memory.get_memory()
-            or x,  # type: ignore[arg-type]
-            Msg("system", self.parser.format_instruction, "system"),
+            self.prompt_prefix.assemble(
+                self.memory
+                and self.memory.get_memory()
+                or x,  # type: ignore[arg-type]
+            ),
         )
 
-        # call llm
-        raw_response = self.model(prompt)
+        cache_key = None
+        cached = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(
+                self.sys_prompt,
+                prompt,
+                self.parser.format_instruction,
+                getattr(self.model, "model_name", None),
+                getattr(self.model, "generate_args", None),
+            )
+            if use_cache:
+                cached = self.cache.get(cache_key)
 
-        self.speak(raw_response.stream or raw_response.text)
+        start = time.perf_counter()
+        if cached is not None:
+            raw_response = ModelResponse(text=cached)
+        else:
+            # call llm
+            metrics.PROMPT_TOKENS.observe(
+                self._estimate_prompt_tokens(prompt),
+                agent=self.name,
+            )
+            raw_response = self.model(prompt)
 
-        # Parsing the raw response
-        res = self.parser.parse(raw_response)
+        try:
+            stream = raw_response.stream
+            if stream is not None:
+                stream = self._time_first_chunk(stream, start)
+            elif cached is None:
+                metrics.MODEL_TTFT_SECONDS.observe(
+                    time.perf_counter() - start,
+                    agent=self.name,
+                )
+
+            if on_stream is not None and stream is not None:
+                try:
+                    self.speak(self._watch_stream(stream, on_stream))
+                except Exception:
+                    # The callback rejected the partial response, stop the
+                    # generation instead of waiting for the remaining tokens.
+                    self._abort_stream(raw_response)
+                    raise
+            else:
+                self.speak(stream or raw_response.text)
+                if on_stream is not None:
+                    self._watch_text(raw_response.text, on_stream)
+
+            if stream is not None:
+                # The parser deep-copies the response on failure, which does
+                # not work with the exhausted generator attached.
+                raw_response = ModelResponse(text=raw_response.text)
+
+            # Parsing the raw response
+            with metrics.timer(metrics.PARSE_SECONDS, agent=self.name):
+                res = self.parser.parse(raw_response)
+        finally:
+            metrics.MODEL_CALL_SECONDS.observe(
+                time.perf_counter() - start,
+                agent=self.name,
+                cached=cached is not None,
+            )
+
+        if cached is None:
+            metrics.COMPLETION_TOKENS.observe(
+                estimate_tokens(raw_response.text),
+                agent=self.name,
+            )
+
+        # Only cache responses which can be parsed
+        if cache_key is not None and cached is None:
+            self.cache.set(cache_key, raw_response.text)
 
         # Filter the parsed response by keys for storing in memory, returning
         # in the reply function, and feeding into the metadata field in the
@@ -118,3 +228,143 @@ class DictDialogAgent(AgentBase):
         )
 
         return msg
+
+    @staticmethod
+    def _estimate_prompt_tokens(prompt: Union[str, list]) -> int:
+        """Estimate the tokens of a formatted prompt."""
+        if isinstance(prompt, str):
+            return estimate_tokens(prompt)
+        return sum(
+            estimate_tokens(str(message.get("content", "")))
+            if isinstance(message, dict)
+            else estimate_tokens(str(message))
+            for message in prompt
+        )
+
+    def _time_first_chunk(
+            self,
+            stream: Generator[Tuple[bool, str], None, None],
+            start: float,
+    ) -> Generator[Tuple[bool, str], None, None]:
+        """Record the time to the first streamed chunk."""
+        first = True
+        for last, text in stream:
+            if first:
+                first = False
+                metrics.MODEL_TTFT_SECONDS.observe(
+                    time.perf_counter() - start,
+                    agent=self.name,
+                )
+                if last:
+                    # `log_stream_msg` fails on a stream with a single
+                    # chunk, open the stream with an empty chunk.
+                    yield False, ""
+            yield last, text
+
+    @staticmethod
+    def _watch_stream(
+            stream: Generator[Tuple[bool, str], None, None],
+            on_stream: Callable[[MarkdownJsonStreamParser], None],
+    ) -> Generator[Tuple[bool, str], None, None]:
+        """Feed the stream into an incremental parser, passing the chunks
+        through unchanged so they are still spoken."""
+        parser = MarkdownJsonStreamParser()
+        length = 0
+        for last, text in stream:
+            # the model wrappers yield the cumulative text
+            if parser.feed(text[length:]) or last:
+                on_stream(parser)
+            length = len(text)
+            yield last, text
+
+    @staticmethod
+    def _abort_stream(raw_response: ModelResponse) -> None:
+        """Close a partially consumed stream and, when possible, the
+        underlying HTTP response so the provider stops generating."""
+        stream = getattr(raw_response, "_stream", None)
+        if stream is None:
+            return
+        # The model wrappers (e.g. openai_chat) keep the provider stream in
+        # the closure of their generator, it is only reachable while the
+        # generator is suspended.
+        frame = getattr(stream, "gi_frame", None)
+        source = frame.f_locals.get("response") if frame is not None else None
+        stream.close()
+        if hasattr(source, "close"):
+            source.close()
+
+    @staticmethod
+    def _watch_text(
+            text: str,
+            on_stream: Callable[[MarkdownJsonStreamParser], None],
+    ) -> None:
+        """Report a complete response through the streaming callback."""
+        parser = MarkdownJsonStreamParser()
+        parser.feed(text)
+        on_stream(parser)
+
+    async def areply(
+            self,
+            x: Optional[Union[Msg, Sequence[Msg]]] = None,
+            timeout: Optional[float] = None,
+            semaphore: Optional[asyncio.Semaphore] = None,
+            executor: Optional[Executor] = None,
+            use_cache: bool = True,
+            on_stream: Optional[Callable[[MarkdownJsonStreamParser], None]] = None,
+    ) -> Msg:
+        """Asynchronous version of `reply`.
+
+        The blocking model call runs in an executor so the event loop keeps
+        serving other tables while the request is in flight.
+
+        Args:
+            x (`Optional[Union[Msg, Sequence[Msg]]]`, defaults to `None`):
+                The input message(s) to the agent.
+            timeout (`Optional[float]`, defaults to `None`):
+                Deadline of the call in seconds. `asyncio.TimeoutError` is
+                raised when it expires, after the streamed generation has
+                been aborted and the worker thread has returned.
+            semaphore (`Optional[asyncio.Semaphore]`, defaults to `None`):
+                Bounds the number of concurrent model calls, usually shared
+                by all agents served by one event loop.
+            executor (`Optional[Executor]`, defaults to `None`):
+                The executor running the blocking call, defaults to the
+                loop's default executor.
+            use_cache (`bool`, defaults to `True`):
+                Whether to look up the response cache.
+            on_stream (`Optional[Callable[[MarkdownJsonStreamParser], None]]`,
+            defaults to `None`):
+                The streaming callback of `reply`, invoked from the worker
+                thread.
+
+        Returns:
+            `Msg`: The output message generated by the agent.
+        """
+        loop = asyncio.get_running_loop()
+        abandoned = threading.Event()
+
+        def watch(parser: MarkdownJsonStreamParser) -> None:
+            if abandoned.is_set():
+                raise _ReplyAbandoned()
+            if on_stream is not None:
+                on_stream(parser)
+
+        async with semaphore or contextlib.nullcontext():
+            future = loop.run_in_executor(
+                executor,
+                self.reply,
+                x,
+                use_cache,
+                watch,
+            )
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # Abort the stream at the next chunk and keep the slot until
+                # the worker thread has actually stopped, so the semaphore
+                # still bounds the requests in flight.
+                abandoned.set()
+                await asyncio.wait([future])
+                if not future.cancelled():
+                    future.exception()
+                raise
@@ -0,0 +1,74 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import re
+import threading
+from typing import Dict, Optional, Sequence, Union
+
+from agentscope.message import Msg
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Roughly estimate the number of tokens of a text without a tokenizer.
+
+    Chinese characters and full-width punctuation usually take about one
+    token each, other characters about a quarter of a token."""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class PromptPrefix:
+    """The stable prompt prefix of an agent.
+
+    The system prompt and the parser's format instruction never change for
+    an agent, so they are merged into a single leading system message that
+    is built once and reused for every call. The volatile round state comes
+    last, which keeps the prefix byte-identical across calls and lets
+    providers with prefix caching reuse it.
+
+    Token counts are estimated per section: the stable sections once, the
+    volatile state on every call."""
+
+    def __init__(self, sections: Dict[str, str]) -> None:
+        """Initialize the prefix.
+
+        Arguments:
+            sections (`Dict[str, str]`):
+                The stable sections in prompt order, e.g. the rules, the role
+                and the format instruction.
+        """
+        self.content = "\n\n".join(text.strip("\n") for text in sections.values() if text)
+        self.msg = Msg("system", self.content, role="system")
+        self.section_tokens = {name: estimate_tokens(text) for name, text in sections.items()}
+        self.prefix_tokens = estimate_tokens(self.content)
+        self.calls = 0
+        self.volatile_tokens = 0
+        self._lock = threading.Lock()
+
+    def assemble(self, x: Optional[Union[Msg, Sequence[Msg]]]) -> list:
+        """Return the messages to format: the stable prefix first, then the
+        volatile input."""
+        msgs = x if isinstance(x, (list, tuple)) else [x] if x is not None else []
+        volatile = sum(estimate_tokens(str(msg.content)) for msg in msgs)
+        with self._lock:
+            self.calls += 1
+            self.volatile_tokens += volatile
+        return [self.msg, *msgs]
+
+    def stats(self) -> dict:
+        """Estimated token counts of the prefix sections and the average
+        volatile input per call."""
+        with self._lock:
+            calls = self.calls
+            volatile = self.volatile_tokens / calls if calls else 0.0
+        total = self.prefix_tokens + volatile
+        return {
+            "calls": calls,
+            "sections": dict(self.section_tokens),
+            "prefix_tokens": self.prefix_tokens,
+            "mean_volatile_tokens": volatile,
+            "prefix_share": self.prefix_tokens / total if total else 0.0,
+        }
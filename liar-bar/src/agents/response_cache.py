@@ -0,0 +1,221 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class ResponseCache:
+    """An in-memory LRU cache of raw model responses with optional TTL.
+
+    Keys are canonical hashes of everything that determines a model call,
+    see `make_key`. Values are the raw response texts, so a cache hit is
+    still parsed by the agent's parser as usual."""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None) -> None:
+        """Initialize the cache.
+
+        Arguments:
+            max_size (`int`, defaults to `1024`):
+                The maximum number of entries, the least recently used entry
+                is evicted when exceeded.
+            ttl (`Optional[float]`, defaults to `None`):
+                Seconds before an entry expires, `None` means never.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Build a canonical hash from the given parts, e.g. the system
+        prompt, the formatted prompt, the format instruction and the
+        generate args."""
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response text, or `None` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response text."""
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Hit/miss counters used to size the cache."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class SqliteResponseCache(ResponseCache):
+    """A `ResponseCache` persisted in a SQLite file, so that batch
+    simulations and demo replays can share responses across processes and
+    restarts.
+
+    Writes, including the access times updated by hits, are committed in
+    batches: after `commit_every` writes, or by a background timer
+    `commit_interval` seconds after the first pending write, so other
+    processes are never blocked for longer. `close` commits the rest. The
+    number of rows is tracked in memory and re-counted at every commit, to
+    pick up rows written by other processes."""
+
+    def __init__(
+            self,
+            path: str,
+            max_size: int = 100000,
+            ttl: Optional[float] = None,
+            commit_every: int = 64,
+            commit_interval: float = 1.0,
+    ) -> None:
+        """Initialize the cache.
+
+        Arguments:
+            path (`str`):
+                The SQLite database file.
+            max_size (`int`, defaults to `100000`):
+                The maximum number of entries.
+            ttl (`Optional[float]`, defaults to `None`):
+                Seconds before an entry expires, `None` means never.
+            commit_every (`int`, defaults to `64`):
+                The number of pending writes that triggers a commit.
+            commit_interval (`float`, defaults to `1.0`):
+                The longest time in seconds a write stays uncommitted.
+        """
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)",
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)",
+        )
+        self._conn.commit()
+        self._pending = 0
+        self._timer = None
+        self._size = self._count()
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _commit(self) -> None:
+        self._conn.commit()
+        self._pending = 0
+        self._size = self._count()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _written(self) -> None:
+        """Count a write, commit when the batch is full and otherwise make
+        sure a timer commits it later."""
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._commit()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.commit_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,),
+            ).fetchone()
+            if row is not None and self._expired(row[1]):
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= 1
+                self.evictions += 1
+                self._written()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key),
+            )
+            self._written()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            now = time.time()
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            ).rowcount
+            if inserted:
+                self._size += 1
+            else:
+                self._conn.execute(
+                    "UPDATE responses SET value = ?, created_at = ?, accessed_at = ? WHERE key = ?",
+                    (value, now, now, key),
+                )
+            overflow = self._size - self.max_size
+            if overflow > 0:
+                deleted = self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+                self._size -= deleted
+                self.evictions += deleted
+            self._written()
+
+    def flush(self) -> None:
+        """Commit the pending writes."""
+        with self._lock:
+            if self._pending:
+                self._commit()
+            elif self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
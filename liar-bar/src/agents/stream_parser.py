@@ -0,0 +1,174 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+"""Incremental parser for streamed Markdown-JSON dict responses."""
+import json
+from typing import Any, Dict, List, Optional
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class MarkdownJsonStreamParser:
+    """Parse a Markdown-JSON dict response (e.g. the output expected by
+    `MarkdownJsonDictParser`) chunk by chunk while it is being streamed.
+
+    Only the top level of the object is exposed:
+
+    - string values are available in `fields` while they are still being
+      written, so partial `thought` text can be displayed immediately;
+    - arrays are exposed as lists holding the string items completed so far,
+      e.g. `cards` grows from `[]` to `["Q"]` to `["Q", "Q"]`;
+    - other scalars appear once they are complete.
+
+    A key is added to `completed` as soon as its value is closed, so callers
+    can act on `action` and `cards` before the rest of the response arrives.
+    Any text before the first `{` (such as the ```json fence) is skipped.
+    """
+
+    def __init__(self) -> None:
+        self.fields: Dict[str, Any] = {}
+        self.completed: List[str] = []
+        self.done = False
+        self._started = False
+        self._depth = 0
+        self._expect_key = True
+        self._key: Optional[str] = None
+        self._array: Optional[list] = None
+        self._in_string = False
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._string: List[str] = []
+        self._string_role: Optional[str] = None
+        self._scalar: List[str] = []
+
+    def feed(self, chunk: str) -> List[str]:
+        """Consume the next chunk of the response.
+
+        Args:
+            chunk (`str`):
+                The newly generated text, not the cumulative text.
+
+        Returns:
+            `List[str]`: The top-level keys whose value changed.
+        """
+        changed = []
+        for char in chunk:
+            if self.done:
+                break
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                self._feed_string(char, changed)
+            else:
+                self._feed_structure(char, changed)
+        # Expose the partial top-level string once per chunk rather than
+        # once per character.
+        if self._in_string and self._string_role == "value":
+            self.fields[self._key] = "".join(self._string)
+            if self._key not in changed:
+                changed.append(self._key)
+        return changed
+
+    def is_complete(self, key: str) -> bool:
+        """Whether the value of `key` has been fully received."""
+        return key in self.completed
+
+    def _feed_string(self, char: str, changed: List[str]) -> None:
+        if self._unicode is not None:
+            self._unicode += char
+            if len(self._unicode) == 4:
+                try:
+                    self._string.append(chr(int(self._unicode, 16)))
+                except ValueError:
+                    self._string.append(self._unicode)
+                self._unicode = None
+        elif self._escape:
+            self._escape = False
+            if char == "u":
+                self._unicode = ""
+            else:
+                self._string.append(_ESCAPES.get(char, char))
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            self._end_string(changed)
+        else:
+            self._string.append(char)
+
+    def _end_string(self, changed: List[str]) -> None:
+        text = "".join(self._string)
+        self._string = []
+        if self._string_role == "key":
+            self._key = text
+        elif self._string_role == "value":
+            self._complete(text, changed)
+        elif self._string_role == "item":
+            self._array.append(text)
+            changed.append(self._key)
+
+    def _feed_structure(self, char: str, changed: List[str]) -> None:
+        depth = self._depth
+        if char == '"':
+            self._in_string = True
+            if depth == 1:
+                self._string_role = "key" if self._expect_key else "value"
+            elif depth == 2 and self._array is not None:
+                self._string_role = "item"
+            else:
+                self._string_role = None
+        elif char in "[{":
+            self._depth += 1
+            if depth == 1 and not self._expect_key:
+                if char == "[":
+                    self._array = []
+                    self.fields[self._key] = self._array
+                    changed.append(self._key)
+        elif char in "]}":
+            if depth == 1:
+                self._end_scalar(changed)
+                self.done = True
+            elif depth == 2 and self._key is not None:
+                # nested objects are not exposed, only arrays
+                if self._array is not None:
+                    self._complete(self._array, changed)
+                self._array = None
+            self._depth -= 1
+        elif depth == 1:
+            if char == ":":
+                self._expect_key = False
+            elif char == ",":
+                self._end_scalar(changed)
+                self._expect_key = True
+                self._key = None
+            elif not char.isspace() and not self._expect_key:
+                self._scalar.append(char)
+
+    def _end_scalar(self, changed: List[str]) -> None:
+        if not self._scalar:
+            return
+        raw = "".join(self._scalar)
+        self._scalar = []
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw
+        self._complete(value, changed)
+
+    def _complete(self, value: Any, changed: List[str]) -> None:
+        self.fields[self._key] = value
+        if self._key not in self.completed:
+            self.completed.append(self._key)
+        if self._key not in changed:
+            changed.append(self._key)
@@ -0,0 +1,132 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+from array import array
+from collections.abc import MutableMapping
+
+from game.compact_state import CARD_CODES, NUM_TYPES, CompactState, decode_counts, encode_cards
+from game.deck import CARD_TYPES
+from game.game import Game
+
+
+class _PlayerStatus(MutableMapping):
+    """玩家状态视图，is_alive 和 elimination_factor 直接读写紧凑状态中的数组"""
+
+    __slots__ = ("_state", "_index", "_extra")
+
+    def __init__(self, state, index):
+        self._state = state
+        self._index = index
+        self._extra = {}
+
+    def __getitem__(self, key):
+        if key == "is_alive":
+            return bool(self._state.alive[self._index])
+        if key == "elimination_factor":
+            return self._state.factors[self._index]
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key == "is_alive":
+            self._state.alive[self._index] = 1 if value else 0
+        elif key == "elimination_factor":
+            self._state.factors[self._index] = value
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        del self._extra[key]
+
+    def __iter__(self):
+        yield "is_alive"
+        yield "elimination_factor"
+        yield from self._extra
+
+    def __len__(self):
+        return 2 + len(self._extra)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CompactGame(Game):
+    """以 CompactState 作为状态核心的 Game，对外保持 Game 原有的接口，
+    Streamlit 页面可以直接替换使用；手牌、存活状态和淘汰概率都保存在紧凑状态中。
+    player_cards 是手牌的只读视图，只在手牌变化后重新解码一次。"""
+
+    def __init__(self, seed=None, verbose=True, context_policy=None, probability_hint=False, decision_router=None):
+        self.state = CompactState()
+        self._names = []
+        self._index = {}
+        self._status_views = {}
+        self._cards_view = None
+        super().__init__(seed=seed, verbose=verbose, context_policy=context_policy, probability_hint=probability_hint,
+                         decision_router=decision_router)
+        self.state.rng = self.rng
+
+    @property
+    def player_status(self):
+        return self._status_views
+
+    @player_status.setter
+    def player_status(self, value):
+        self._names = list(value)
+        self._index = {player: i for i, player in enumerate(self._names)}
+        self._status_views = {}
+        for i, (player, status) in enumerate(value.items()):
+            view = _PlayerStatus(self.state, i)
+            view.update(status)
+            self._status_views[player] = view
+
+    @property
+    def player_cards(self):
+        if self._cards_view is None:
+            self._cards_view = {player: decode_counts(self.state.hand(i)) for i, player in enumerate(self._names)}
+        return self._cards_view
+
+    @player_cards.setter
+    def player_cards(self, value):
+        self._cards_view = None
+        for player, cards in value.items():
+            base = self._index[player] * NUM_TYPES
+            self.state.hands[base:base + NUM_TYPES] = array("b", encode_cards(cards))
+
+    @property
+    def current_player(self):
+        return self._names[self.state.current]
+
+    @current_player.setter
+    def current_player(self, player):
+        self.state.current = self._index[player]
+
+    @property
+    def target_card(self):
+        return CARD_TYPES[self.state.target] if self.state.target >= 0 else ""
+
+    @target_card.setter
+    def target_card(self, card):
+        self.state.target = CARD_CODES[card] if card else -1
+
+    def check_played_cards(self, played_cards):
+        """检查玩家是否 played_cards 是否合法"""
+        try:
+            counts = encode_cards(played_cards)
+        except KeyError:
+            return False
+        return self.state.can_play(*counts)
+
+    def update_current_player_cards(self, played_cards):
+        """更新当前玩家的卡牌"""
+        current = self.state.current
+        base = current * NUM_TYPES
+        hands = self.state.hands
+        for card in played_cards:
+            hands[base + CARD_CODES[card.upper()]] -= 1
+        if self._cards_view is not None:
+            # 只有当前玩家的手牌变化，其他玩家的视图保持不变
+            self._cards_view[self._names[current]] = decode_counts(self.state.hand(current))
+
+    def _deal(self):
+        """在紧凑状态中发牌，返回目标牌和每个玩家的手牌用于记录事件"""
+        self.state.deal()
+        self._cards_view = None
+        return self.target_card, self.player_cards
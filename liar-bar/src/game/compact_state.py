@@ -0,0 +1,177 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import random
+from array import array
+
+from game.deck import CARD_TYPES, CARDS_PER_TYPE, DECK_SIZE, HAND_SIZE, WILDCARDS
+
+# 卡牌编码：A=0, K=1, Q=2
+CARD_CODES = {card: code for code, card in enumerate(CARD_TYPES)}
+NUM_TYPES = len(CARD_TYPES)
+BASE_DECK = bytes(code for code in range(NUM_TYPES) for _ in range(CARDS_PER_TYPE))
+
+TRUST = 0
+CHALLENGE = 1
+# 一轮记录的字段：玩家、动作、A/K/Q 的数量
+ENTRY_SIZE = 2 + NUM_TYPES
+# 每次出牌至少一张，一轮最多出牌 DECK_SIZE 次，再加上一次质疑
+MAX_ROUND_ENTRIES = DECK_SIZE + 1
+MAX_ELIMINATION_FACTOR = 5
+
+
+def encode_cards(cards):
+    """把卡牌列表编码为 A/K/Q 的数量"""
+    counts = [0] * NUM_TYPES
+    for card in cards:
+        counts[CARD_CODES[card.upper()]] += 1
+    return counts
+
+
+def decode_counts(counts):
+    """把 A/K/Q 的数量还原为卡牌列表"""
+    return [card for card, num in zip(CARD_TYPES, counts) for _ in range(num)]
+
+
+class CompactState:
+    """用于模拟和搜索的紧凑游戏状态：卡牌编码为整数，手牌为 A/K/Q 数量向量，
+    玩家为下标，本轮记录存放在预分配的定长数组中。出牌过程不分配新对象，
+    clone() 只复制几个小数组，适合搜索时大量复制状态。
+
+    规则与 Game.play、Game._eliminate_check、Game._next_player 保持一致。"""
+
+    __slots__ = ("num_players", "target", "current", "round", "hands", "alive", "factors",
+                 "history", "history_len", "deck", "rng")
+
+    def __init__(self, num_players=4, rng=None, seed=None):
+        self.num_players = num_players
+        self.target = -1
+        self.current = 0
+        self.round = 1
+        self.hands = array("b", bytes(num_players * NUM_TYPES))
+        self.alive = array("b", [1] * num_players)
+        self.factors = array("b", [MAX_ELIMINATION_FACTOR] * num_players)
+        self.history = array("b", bytes(MAX_ROUND_ENTRIES * ENTRY_SIZE))
+        self.history_len = 0
+        self.deck = bytearray(BASE_DECK + bytes(WILDCARDS))
+        self.rng = rng or random.Random(seed)
+
+    def clone(self, rng=None):
+        """复制状态，可以为副本指定独立的随机数生成器"""
+        other = CompactState.__new__(CompactState)
+        other.num_players = self.num_players
+        other.target = self.target
+        other.current = self.current
+        other.round = self.round
+        other.hands = self.hands[:]
+        other.alive = self.alive[:]
+        other.factors = self.factors[:]
+        other.history = self.history[:]
+        other.history_len = self.history_len
+        other.deck = self.deck[:]
+        other.rng = rng or self.rng
+        return other
+
+    def deal(self):
+        """开始新的一轮：选择目标牌，万能牌替换为目标牌，洗牌后每人发5张。
+        直接用 random() 做 Fisher-Yates 洗牌，比 Random.shuffle 逐次调用 _randbelow 快得多"""
+        random = self.rng.random
+        target = int(random() * NUM_TYPES)
+        deck = self.deck
+        deck[:len(BASE_DECK)] = BASE_DECK
+        for i in range(len(BASE_DECK), DECK_SIZE):
+            deck[i] = target
+        for i in range(DECK_SIZE - 1, 0, -1):
+            j = int(random() * (i + 1))
+            deck[i], deck[j] = deck[j], deck[i]
+        hands = self.hands
+        for i in range(len(hands)):
+            hands[i] = 0
+        for player in range(self.num_players):
+            base = player * NUM_TYPES
+            for i in range(player * HAND_SIZE, (player + 1) * HAND_SIZE):
+                hands[base + deck[i]] += 1
+        self.target = target
+        self.history_len = 0
+
+    def hand(self, player):
+        base = player * NUM_TYPES
+        return self.hands[base:base + NUM_TYPES]
+
+    def hand_size(self, player):
+        base = player * NUM_TYPES
+        return self.hands[base] + self.hands[base + 1] + self.hands[base + 2]
+
+    def can_play(self, a, k, q):
+        """当前玩家手里是否有这些牌"""
+        base = self.current * NUM_TYPES
+        hands = self.hands
+        return hands[base] >= a and hands[base + 1] >= k and hands[base + 2] >= q
+
+    def last_play(self):
+        """本轮最后一条记录的下标，没有记录时返回-1"""
+        return (self.history_len - 1) * ENTRY_SIZE if self.history_len else -1
+
+    def _record(self, player, action, a, k, q):
+        offset = self.history_len * ENTRY_SIZE
+        history = self.history
+        history[offset] = player
+        history[offset + 1] = action
+        history[offset + 2] = a
+        history[offset + 3] = k
+        history[offset + 4] = q
+        self.history_len += 1
+
+    def next_player(self, player):
+        """下一个存活的玩家"""
+        num_players = self.num_players
+        player = (player + 1) % num_players
+        while not self.alive[player]:
+            player = (player + 1) % num_players
+        return player
+
+    def play(self, a, k, q):
+        """当前玩家打出 a 张A、k 张K、q 张Q，并轮到下一个玩家"""
+        base = self.current * NUM_TYPES
+        hands = self.hands
+        hands[base] -= a
+        hands[base + 1] -= k
+        hands[base + 2] -= q
+        self._record(self.current, TRUST, a, k, q)
+        self.current = self.next_player(self.current)
+
+    def eliminate_check(self, player):
+        """与 randint(1, factor) == 1 的概率相同"""
+        return self.rng.random() * self.factors[player] < 1
+
+    def challenge(self):
+        """当前玩家质疑上家，结算惩罚后开始新的一轮
+
+        Returns:
+            Tuple[bool, int, int, bool]: 上家是否全部为目标牌、上家、被惩罚的玩家、被惩罚的玩家是否出局
+        """
+        offset = self.last_play()
+        history = self.history
+        last_player = history[offset]
+        # 打出的牌全部为目标牌
+        honest = history[offset + 2 + self.target] == history[offset + 2] + history[offset + 3] + history[offset + 4]
+        self._record(self.current, CHALLENGE, 0, 0, 0)
+        punished = self.current if honest else last_player
+        self.current = punished
+        eliminated = self.eliminate_check(punished)
+        if eliminated:
+            self.alive[punished] = 0
+            self.current = self.next_player(punished)
+        else:
+            self.factors[punished] -= 1
+        self.round += 1
+        self.deal()
+        return honest, last_player, punished, eliminated
+
+    def alive_count(self):
+        return sum(self.alive)
+
+    def is_over(self):
+        return self.alive_count() == 1
+
+    def winner(self):
+        return self.alive.index(1)
@@ -0,0 +1,93 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+from collections import deque
+
+from agents.prompt_prefix import estimate_tokens
+
+
+class RoundContextPolicy:
+    """提示词中本轮出牌记录的上下文策略
+
+    默认不做任何限制，与完整的出牌记录一致；长局中可以只保留最近 last_n 条记录，
+    更早的记录汇总为每位玩家的出牌次数和张数，并限制每条发言的长度和整体token数，
+    使提示词的大小不随本轮出牌次数增长。
+
+    Args:
+        last_n (int): 完整保留的最近出牌记录条数，None 表示全部保留
+        max_dialog_chars (int): 每条发言保留的最大字数，None 表示不截断
+        max_tokens (int): 出牌记录的token估算上限，超出时把最早的记录并入汇总，None 表示不限制
+        max_dialogs (int): `Game.player_dialog` 保留的最近发言条数，None 表示不限制
+    """
+
+    def __init__(self, last_n=None, max_dialog_chars=None, max_tokens=None, max_dialogs=None):
+        self.last_n = last_n
+        self.max_dialog_chars = max_dialog_chars
+        self.max_tokens = max_tokens
+        self.max_dialogs = max_dialogs
+
+    def format_entry(self, entry):
+        """把一条出牌记录格式化为提示词中的一行"""
+        if len(entry['cards']) == 0:
+            info = f"{entry['player']} 选择了质疑！"
+        else:
+            info = f"{entry['player']} play {len(entry['cards'])}张目标牌！"
+        dialog = entry["dialog"]
+        if dialog:
+            if self.max_dialog_chars is not None and len(dialog) > self.max_dialog_chars:
+                dialog = dialog[:self.max_dialog_chars] + "……"
+            info += f"并且对大家说: {dialog}\n"
+        else:
+            info += "\n"
+        return info
+
+
+class RoundContext:
+    """按照 RoundContextPolicy 增量维护一轮的出牌上下文
+
+    只在读取时处理新增的记录：滑出窗口的记录并入每位玩家的出牌统计，不需要重新遍历整轮记录。"""
+
+    __slots__ = ("policy", "entries", "consumed", "window", "tokens", "summary", "summarized")
+
+    def __init__(self, policy, entries):
+        self.policy = policy
+        self.entries = entries
+        self.consumed = 0
+        # 窗口中的每一行为 (玩家, 出牌张数, 文本, token估算)
+        self.window = deque()
+        self.tokens = 0
+        # 被汇总的记录：玩家 -> [出牌次数, 出牌张数]
+        self.summary = {}
+        self.summarized = 0
+
+    def _summarize_oldest(self):
+        player, num, _, tokens = self.window.popleft()
+        self.tokens -= tokens
+        counts = self.summary.setdefault(player, [0, 0])
+        counts[0] += 1
+        counts[1] += num
+        self.summarized += 1
+
+    def _update(self):
+        policy = self.policy
+        while self.consumed < len(self.entries):
+            entry = self.entries[self.consumed]
+            self.consumed += 1
+            line = policy.format_entry(entry)
+            tokens = estimate_tokens(line) if policy.max_tokens is not None else 0
+            self.window.append((entry["player"], len(entry["cards"]), line, tokens))
+            self.tokens += tokens
+            if policy.last_n is not None and len(self.window) > policy.last_n:
+                self._summarize_oldest()
+        if policy.max_tokens is not None:
+            # 至少保留最后一条，也就是上家的出牌
+            while len(self.window) > 1 and self.tokens > policy.max_tokens:
+                self._summarize_oldest()
+
+    def render(self):
+        """本轮出牌情况的提示词"""
+        self._update()
+        info = ""
+        if self.summarized:
+            plays = ", ".join(f"{player} 出牌{counts[0]}次共{counts[1]}张" for player, counts in self.summary.items())
+            info = f"更早的{self.summarized}条出牌记录: {plays}\n"
+        return info + "".join(line for _, _, line, _ in self.window)
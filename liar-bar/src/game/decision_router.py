@@ -0,0 +1,118 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import random
+import threading
+from collections import Counter
+
+from instrumentation import metrics
+
+# 本地决策的路由原因，"model" 表示调用模型决策，"dialog" 表示本地决策后只调用模型生成发言
+LOCAL_ROUTES = ("forced", "first_play", "divination", "all_target", "clear_challenge")
+
+
+class DecisionRouter:
+    """决策路由：局面简单或者结论明确时由角色的规则策略（policies.personas）决定行动和出牌，
+    只有存在争议的质疑决策才调用模型，从而减少每局的模型调用次数。
+
+    本地决策的局面：
+    - forced：手牌已经打完，只能质疑；
+    - all_target：手里全是目标牌，并且上家诚实的概率不低于 trust_above，角色策略选择出牌时直接出牌；
+    - clear_challenge：上家诚实的概率不高于 challenge_below，并且角色策略同样选择质疑；
+    - first_play（需要开启）：本轮第一个出牌，只能出牌，出哪些牌由角色策略决定；
+    - divination（需要开启）：占卜师按照规则策略中的占卜结果行动，不再调用模型。
+
+    后两种会改变角色在这些局面下的表现（出牌由规则策略而不是模型决定），默认关闭。
+    概率来自 `game.honesty_table`。本地决策默认使用角色策略的发言，也可以按 dialog_rate 的比例
+    继续调用模型，只让模型为已经确定的行动生成迷惑对手的发言。
+
+    Args:
+        challenge_below (float): 上家诚实的概率不高于该值且角色策略选择质疑时直接质疑，None 表示不启用
+        trust_above (float): 手里全是目标牌且上家诚实的概率不低于该值时直接出牌，None 表示不启用
+        route_first_play (bool): 本轮第一个出牌时是否本地决策
+        route_divination (bool): 占卜师是否本地决策
+        dialog_rate (float): 本地决策后仍然调用模型生成发言的比例
+        seed (int): 路由器自己的随机种子，不使用游戏的随机数生成器，开启路由不会改变发牌和惩罚的随机序列
+    """
+
+    def __init__(self, challenge_below=0.05, trust_above=0.5, route_first_play=False, route_divination=False,
+                 dialog_rate=0.0, seed=None):
+        self.challenge_below = challenge_below
+        self.trust_above = trust_above
+        self.route_first_play = route_first_play
+        self.route_divination = route_divination
+        self.dialog_rate = dialog_rate
+        self.rng = random.Random(seed)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ask(game, policy):
+        """询问角色策略的决策，策略抽取的随机数不影响游戏的随机序列（发牌和惩罚）"""
+        state = game.rng.getstate()
+        try:
+            return policy(game)
+        finally:
+            game.rng.setstate(state)
+
+    def _decide(self, game, policy):
+        """返回 (路由原因, 决策)，需要调用模型时决策为None"""
+        cards = game.player_cards[game.current_player]
+        style = game.player_status[game.current_player]["style"]
+        if not game.current_round:
+            return ("first_play", self._ask(game, policy)) if self.route_first_play else ("model", None)
+        if not cards:
+            # 所有角色策略在手牌打完时都会质疑，并且使用角色自己的发言
+            return "forced", self._ask(game, policy)
+        if style == "augur" and self.route_divination:
+            return "divination", self._ask(game, policy)
+        probability = game.probability_last_play_honest()
+        if self.challenge_below is not None and probability <= self.challenge_below:
+            decision = self._ask(game, policy)
+            if decision[0] == game.action_space[1]:
+                return "clear_challenge", decision
+        if (self.trust_above is not None and probability >= self.trust_above
+                and all(card == game.target_card for card in cards)):
+            decision = self._ask(game, policy)
+            if decision[0] == game.action_space[0]:
+                return "all_target", decision
+        return "model", None
+
+    def route(self, game):
+        """为当前玩家选择决策方式
+
+        Returns:
+            Tuple[str, tuple]: 路由原因和本地决策 (action, cards, thought, dialog)，
+                原因为 "model" 时决策为None，需要调用模型
+        """
+        status = game.player_status[game.current_player]
+        policy = status.get("policy")
+        if policy is None:
+            route, decision = "model", None
+        else:
+            route, decision = self._decide(game, policy)
+            if decision is not None and self.dialog_rate:
+                with self._lock:
+                    use_model = self.rng.random() < self.dialog_rate
+                if use_model:
+                    route = "dialog"
+        self.record(status["style"], route)
+        return route, decision
+
+    def record(self, style, route):
+        metrics.ROUTED_DECISIONS.inc(style=style, route=route)
+        with self._lock:
+            self.counts[route] += 1
+
+    @property
+    def saved_rate(self):
+        """本地决策、没有调用模型的比例"""
+        with self._lock:
+            total = sum(self.counts.values())
+            saved = sum(self.counts[route] for route in LOCAL_ROUTES)
+        return saved / total if total else 0.0
+
+    def summary(self):
+        with self._lock:
+            counts = dict(self.counts)
+        details = ", ".join(f"{route}: {count}" for route, count in sorted(counts.items()))
+        return f"decisions: {sum(counts.values())}, saved model calls: {self.saved_rate:.1%} ({details})"
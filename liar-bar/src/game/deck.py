@@ -0,0 +1,43 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+
+# 基础牌型，以及每种牌型的数量（6张Q、6张K、6张A）
+CARD_TYPES = "AKQ"
+CARDS_PER_TYPE = 6
+# 万能牌数量，发牌时替换为本轮目标牌
+WILDCARDS = 2
+HAND_SIZE = 5
+# 每次最多出牌数量
+MAX_PLAY = 3
+
+BASE_COMPOSITION = (CARD_TYPES * CARDS_PER_TYPE).encode("ascii")
+DECK_SIZE = len(BASE_COMPOSITION) + WILDCARDS
+
+
+class Deck:
+    """固定20张牌的牌组，使用定长的字节数组存储，每轮只重置万能牌并洗牌，
+    因此开局成本与游戏进行了多少轮无关。"""
+
+    __slots__ = ("cards",)
+
+    def __init__(self):
+        self.cards = bytearray(BASE_COMPOSITION + b"?" * WILDCARDS)
+
+    def __len__(self):
+        return DECK_SIZE
+
+    def new_round(self, rng):
+        """随机选择本轮目标牌，把万能牌替换为目标牌并洗牌，返回目标牌"""
+        target_card = rng.choice(CARD_TYPES)
+        self.cards[:len(BASE_COMPOSITION)] = BASE_COMPOSITION
+        self.cards[len(BASE_COMPOSITION):] = target_card.encode("ascii") * WILDCARDS
+        rng.shuffle(self.cards)
+        return target_card
+
+    def deal(self, seat, hand_size=HAND_SIZE):
+        """按座位切出一手牌"""
+        start = seat * hand_size
+        return list(self.cards[start:start + hand_size].decode("ascii"))
+
+    def to_list(self):
+        return list(self.cards.decode("ascii"))
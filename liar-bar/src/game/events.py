@@ -0,0 +1,91 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import json
+import os
+
+# 事件类型，Game 的所有状态变化都由这些事件驱动
+START = "start"              # 设置玩家角色: {"styles": [...]}
+DEAL = "deal"                # 发牌: {"round": 1, "target": "K", "hands": {"player1": [...], ...}}
+PLAY = "play"                # 出牌: {"player": "player1", "cards": [...], "thought": ..., "dialog": ...}
+CHALLENGE = "challenge"      # 质疑: {"player": "player2", "thought": ..., "dialog": ...}
+PUNISHMENT = "punishment"    # 惩罚: {"player": "player1", "honest": true, "eliminated": false}
+ELIMINATION = "elimination"  # 出局: {"player": "player1"}
+
+SEGMENT_PREFIX = "events-"
+SEGMENT_SUFFIX = ".jsonl"
+
+
+def dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+class EventWriter:
+    """追加写入的事件归档，每局游戏一行 JSON，文件超过 segment_bytes 后切换到新的分段文件。
+    写入在缓冲区中攒批，每 fsync_every 局执行一次 fsync，兼顾吞吐量和持久性。"""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, fsync_every=1000):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_every = fsync_every
+        self.pending = 0
+        os.makedirs(directory, exist_ok=True)
+        segments = list_segments(directory)
+        self.segment = int(os.path.basename(segments[-1])[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) if segments else 0
+        self.file = None
+        self._open(new_segment=not segments)
+
+    def _open(self, new_segment):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+        if new_segment:
+            self.segment += 1
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self.segment:06d}{SEGMENT_SUFFIX}")
+        self.file = open(path, "a", encoding="utf-8")
+
+    def append(self, events, game_id=None):
+        """写入一局游戏的事件"""
+        self.file.write(dumps({"id": game_id, "events": events}) + "\n")
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.flush()
+        if self.file.tell() >= self.segment_bytes:
+            self._open(new_segment=True)
+
+    def flush(self):
+        """把缓冲区写入磁盘"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def list_segments(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+
+
+def read_events(path):
+    """按顺序读取归档中的每局游戏，path 可以是归档目录或单个分段文件
+
+    Yields:
+        Tuple[Any, List[dict]]: 游戏id和事件列表
+    """
+    paths = list_segments(path) if os.path.isdir(path) else [path]
+    for segment in paths:
+        with open(segment, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["id"], record["events"]
@@ -1,12 +1,20 @@
 # Copyright (c) 2024 King Jingxiang
 # See the LICENSE file for license rights and limitations (MIT).
-import copy
+import asyncio
 import random
-import time
+from collections import deque
 
 import prompts as rule
 import tools.tool as tools
 from agents.dict_dialog_agent import DictDialogAgent
+from game import events as ev
+from game.context_policy import RoundContext, RoundContextPolicy
+from game import honesty_table
+from game.deck import MAX_PLAY, Deck
+from instrumentation import metrics
+from models import client_pool
+from policies import personas
+from agentscope.exception import ResponseParsingError
 from agentscope.message import Msg
 from agentscope.parsers.json_object_parser import MarkdownJsonDictParser
 
@@ -16,42 +24,115 @@ class GameError(Exception):
     pass
 
 
+def render_log_entry(entry, index, target_card, debug=False):
+    """渲染一条出牌记录"""
+    # 使用不同的颜色定义每条记录
+    colors = ["#FF5733", "#33FF57", "#3357FF", "#FF33A1", "#C70039"]  # 示例颜色列表
+    # 选择颜色，并确保颜色索引在有效范围内循环
+    color = colors[index % len(colors)]
+
+    # 构建基础信息
+    if len(entry['cards']) == 0:
+        log_info = f"<span style='color:{color}'>{entry['player']}选择了质疑!<br></span>"
+    else:
+        log_info = f"<span style='color:{color}'>{entry['player']} play {len(entry['cards'])}张目标牌{target_card}<br></span>"
+
+    # 如果有对话，则添加到log_info
+    if entry['dialog']:
+        log_info += f"<span style='color:{color}'>{entry['player']} say: {entry['dialog']}<br></span>"
+
+    # 如果是调试模式且有思考内容，则添加到log_info
+    if debug and entry['thought']:
+        log_info += f"<span style='color:{color}'>{entry['player']} thought: {entry['thought']}<br></span>"
+    return log_info
+
+
+class RoundLogView:
+    """一轮出牌记录的HTML视图，只在读取时渲染新增的记录"""
+
+    __slots__ = ("entries", "target_card", "html", "rendered")
+
+    def __init__(self, entries, target_card):
+        self.entries = entries
+        self.target_card = target_card
+        # 下标0为普通模式，下标1为调试模式
+        self.html = ["", ""]
+        self.rendered = [0, 0]
+
+    def render(self, debug=False):
+        debug = int(bool(debug))
+        while self.rendered[debug] < len(self.entries):
+            index = self.rendered[debug]
+            self.html[debug] += render_log_entry(self.entries[index], index, self.target_card, debug)
+            self.rendered[debug] = index + 1
+        return f"<div>{self.html[debug]}</div>"
+
+
 class Game:
-    def __init__(self):
+    def __init__(self, seed=None, verbose=True, context_policy=None, probability_hint=False, decision_router=None):
         self.player_status = {
-            "player1": {"is_alive": True, "style": "coward", "elimination_factor": 5, "agent": None},
-            "player2": {"is_alive": True, "style": "coward", "elimination_factor": 5, "agent": None},
-            "player3": {"is_alive": True, "style": "coward", "elimination_factor": 5, "agent": None},
-            "player4": {"is_alive": True, "style": "coward", "elimination_factor": 5, "agent": None},
+            "player1": {"is_alive": True, "style": "coward", "elimination_factor": 5, "agent": None,
+                        "policy": None},
+            "player2": {"is_alive": True, "style": "coward", "elimination_factor": 5, "agent": None,
+                        "policy": None},
+            "player3": {"is_alive": True, "style": "coward", "elimination_factor": 5, "agent": None,
+                        "policy": None},
+            "player4": {"is_alive": True, "style": "coward", "elimination_factor": 5, "agent": None,
+                        "policy": None},
         }
-        self.total_rounds = []
-        self.current_round = []
         self.player_cards = {}
-        self.player_dialog = []
+        # 提示词中本轮出牌记录的上下文策略，默认保留完整记录
+        self.context_policy = context_policy or RoundContextPolicy()
+        self.player_dialog = deque(maxlen=self.context_policy.max_dialogs)
         self.challenge_info = []
         self.game_logs = {}
         self.round = 1
         self.current_game_logs = []
+        # 追加式事件流，current_game_logs、game_logs、challenge_info 等都由事件推导而来
+        self.events = []
+        self._round_log_view = RoundLogView(self.current_game_logs, "")
+        self._last_round_log_view = None
+        self._round_context = RoundContext(self.context_policy, self.current_game_logs)
+        self._game_logs_cache = [None, None]
+        self._challenge_info_cache = {}
         self.current_player = "player1"
-        self.total_cards = ["A", "K", "Q"] * 6
+        self.deck = Deck()
         self.target_card = ""
         self.players = ["player1", "player2", "player3", "player4"]
         self.agents = []
         self.model_configuration_name = "aistudio"
         self.action_space = ["trust", "challenge"]
-
-    def initialize_agents(self):
-
+        # 每局游戏独立的随机数生成器，传入seed可复现整局游戏
+        self.rng = random.Random(seed)
+        # 是否在控制台打印对局过程，批量模拟时关闭
+        self.verbose = verbose
+        # 是否在提示词中给出上家出牌全部为目标牌的精确概率，省去模型自己推算
+        self.probability_hint = probability_hint
+        # 决策路由（game.decision_router.DecisionRouter），None 表示AI玩家的每次决策都调用模型
+        self.decision_router = decision_router
+
+    def initialize_agents(self, cache=None, compact_rules=False):
+        """初始化智能体，同一进程中相同配置的智能体只创建一次，所有游戏共享
+
+        Args:
+            cache (ResponseCache): 可选的模型回复缓存（参见 agents.response_cache）
+            compact_rules (bool): 使用精简版规则 `rule.compact_rule`，减少每次调用的输入token
+        """
+        self.agents = client_pool.POOL.get_agents((self.model_configuration_name, compact_rules, cache),
+                                                  lambda: self._build_agents(cache, compact_rules))
+
+    def _build_agents(self, cache=None, compact_rules=False):
+        rules = rule.compact_rule if compact_rules else rule.rule
         agents = [
-            DictDialogAgent("augur", rule.rule + "\n" + rule.augur_role, self.model_configuration_name,
+            DictDialogAgent("augur", rules + "\n" + rule.augur_role, self.model_configuration_name,
                             use_memory=False),
-            DictDialogAgent("coward", rule.rule + "\n" + rule.coward_role, self.model_configuration_name,
+            DictDialogAgent("coward", rules + "\n" + rule.coward_role, self.model_configuration_name,
                             use_memory=False),
-            DictDialogAgent("bold_gambler", rule.rule + "\n" + rule.bold_gambler_rule, self.model_configuration_name,
+            DictDialogAgent("bold_gambler", rules + "\n" + rule.bold_gambler_rule, self.model_configuration_name,
                             use_memory=False),
-            DictDialogAgent("cool_analyzer", rule.rule + "\n" + rule.cool_analyzer_rule, self.model_configuration_name,
+            DictDialogAgent("cool_analyzer", rules + "\n" + rule.cool_analyzer_rule, self.model_configuration_name,
                             use_memory=False),
-            DictDialogAgent("cunning_liar", rule.rule + "\n" + rule.cunning_liar_rule, self.model_configuration_name,
+            DictDialogAgent("cunning_liar", rules + "\n" + rule.cunning_liar_rule, self.model_configuration_name,
                             use_memory=False),
         ]
 
@@ -67,19 +148,27 @@ class Game:
 
         for agent in agents:
             agent.set_parser(parser)
-        self.agents = agents
+            agent.set_cache(cache)
+        return agents
+
+    def get_prompt_stats(self):
+        """每个智能体的提示词token估算：固定前缀各部分的token数以及每次调用的平均可变部分"""
+        return {agent.name: agent.prompt_prefix.stats() for agent in self.agents if agent.prompt_prefix}
 
     def initialize_players(self, styles=None):
-        """初始化玩家状态"""
+        """初始化玩家状态：内置角色都会绑定 policies.personas 中的规则策略，
+        没有智能体的玩家直接使用规则策略决策，有智能体的玩家在模型调用失败时以规则策略兜底"""
         if styles is None:
             styles = ["normal", "user", "normal", "normal"]
 
         # 确保玩家数量与风格列表长度匹配
         assert len(self.players) == len(styles), "玩家数量与风格列表长度不匹配"
+        self._emit({"type": ev.START, "styles": list(styles)})
+        if not self.agents:
+            return
         agent_map = {agent.name: agent for agent in self.agents}
         # 使用enumerate来获取索引和玩家
         for i, player in enumerate(self.players):
-            self.player_status[player]["style"] = styles[i]
             if styles[i] != "user":
                 agent = agent_map.get(styles[i])
                 if agent is not None:
@@ -97,15 +186,22 @@ class Game:
             num = len(self.current_round[-1]["cards"])
             prompt = rule.current_player_prompt.format(player=self.current_player, target_card=self.target_card,
                                                        cards=cards_str, last_player_play_num=num, round_info=round_info)
+            if self.probability_hint:
+                prompt += rule.honesty_hint_prompt.format(
+                    num=num, target_card=self.target_card, probability=self.probability_last_play_honest())
         else:
             prompt = rule.first_player_prompt.format(player=self.current_player, target_card=self.target_card,
                                                      cards=cards_str)
         return prompt
 
+    def probability_last_play_honest(self):
+        """当前玩家视角下上家最后一次出牌全部为目标牌的概率，查询离线计算好的概率表"""
+        return honesty_table.probability_last_play_honest(self)
+
     def check_played_cards(self, played_cards):
         """检查玩家是否 played_cards 是否合法"""
         try:
-            user_cards = copy.deepcopy(self.player_cards[self.current_player])
+            user_cards = list(self.player_cards[self.current_player])
             for c in played_cards:
                 user_cards.remove(c.upper())
             return True
@@ -116,114 +212,332 @@ class Game:
         """获取玩家对话"""
         return "\n".join(self.player_dialog)
 
-    def player_think(self, max_retry=3):
-        # return "trust", self.player_cards[self.current_player][0], None, None
-        agent = self.player_status[self.current_player]["agent"]
+    def _get_think_msg(self, decision=None):
+        """构造发给当前玩家智能体的消息，decision 不为None时只让模型为已经确定的行动生成发言"""
         prompt = self.get_current_player_prompt()
-        if self.player_status[self.current_player]["style"] == "augur":
-            response = tools.execute_divination(self.player_cards[self.current_player], self.target_card)
+        if decision is not None:
+            if decision[0] == self.action_space[1]:
+                move = "质疑上家"
+            else:
+                move = f"打出 {', '.join(decision[1])}"
+            prompt += rule.routed_move_prompt.format(move=move)
+        elif self.player_status[self.current_player]["style"] == "augur":
+            response = tools.execute_divination(self.player_cards[self.current_player], self.target_card,
+                                                self.rng)
             prompt += f"\n{response.content}"
-        msg = Msg(name="user", role="user", content=prompt)
-        for attempt in range(max_retry + 1):  # +1 是因为range从0开始计数
-            try:
-                response = agent(msg)
-                action = response.content["action"]
-                # 检查动作是否合法
-                if action not in self.action_space:
-                    raise GameError(f"Invalid action: {action}")
-                cards = response.content["cards"]
-                if not self.check_played_cards(cards):  # 检查卡牌是否有效
-                    raise GameError("Invalid cards")
-                dialog = response.content.get("misleading_statements", None)
-                thought = response.content.get("thought", None)
-                if dialog:
-                    self.player_dialog.append(f"{self.current_player}: {response.content['misleading_statements']}")
-                return action, cards, thought, dialog  # 成功返回动作和卡牌
-            except GameError as e:
-                if attempt < max_retry:
-                    print(f"Attempt {attempt + 1} failed: {e}. Retrying...")
-                else:
-                    print(f"Failed after {max_retry} attempts. Giving up.")
-        # 异常情况打出第0张牌
-        return "trust", self.player_cards[self.current_player][0], None, None
+        return Msg(name="user", role="user", content=prompt)
+
+    def _route(self):
+        """决策路由，返回 (路由原因, 本地决策)，没有配置路由器时所有决策都调用模型"""
+        if self.decision_router is None:
+            return "model", None
+        return self.decision_router.route(self)
+
+    @staticmethod
+    def _with_dialog(decision, response):
+        """保留本地决策的行动和出牌，采用模型生成的思考和发言"""
+        content = response.content
+        return (decision[0], decision[1], content.get("thought") or decision[2],
+                content.get("misleading_statements") or decision[3])
+
+    def _check_response(self, response):
+        """检查智能体的回复是否合法，合法则返回动作和卡牌，否则抛出GameError"""
+        action = response.content["action"]
+        # 检查动作是否合法
+        if action not in self.action_space:
+            raise GameError(f"Invalid action: {action}")
+        if action == self.action_space[1] and not self.current_round:
+            raise GameError("First player of a round can not challenge")
+        cards = response.content["cards"] or []
+        if not self.check_played_cards(cards):  # 检查卡牌是否有效
+            raise GameError("Invalid cards")
+        # 出牌必须打出1至MAX_PLAY张牌
+        if action == self.action_space[0] and not 0 < len(cards) <= MAX_PLAY:
+            raise GameError(f"Invalid number of cards: {len(cards)}")
+        if cards:
+            cards = [card.upper() for card in cards]
+        dialog = response.content.get("misleading_statements", None)
+        thought = response.content.get("thought", None)
+        return action, cards, thought, dialog  # 成功返回动作和卡牌
+
+    def _stream_validator(self, on_stream=None):
+        """流式校验：action 或者某张牌一出现不合法就抛出 GameError，立即终止本次生成并进入重试，
+        校验通过的部分结果再交给 on_stream"""
+        def validate(parser):
+            fields = parser.fields
+            if parser.is_complete("action"):
+                if fields["action"] not in self.action_space:
+                    raise GameError(f"Invalid action: {fields['action']}")
+                if fields["action"] == self.action_space[1] and not self.current_round:
+                    raise GameError("First player of a round can not challenge")
+            cards = fields.get("cards")
+            # cards 是逐张解析出来的，只要已出现的牌不在手牌中就可以判定不合法
+            if isinstance(cards, list) and cards and not (
+                    all(isinstance(card, str) for card in cards) and self.check_played_cards(cards)):
+                raise GameError("Invalid cards")
+            if isinstance(cards, list) and len(cards) > MAX_PLAY:
+                raise GameError(f"Invalid number of cards: {len(cards)}")
+            if (parser.is_complete("cards") and not cards and parser.is_complete("action")
+                    and fields["action"] == self.action_space[0]):
+                raise GameError("Invalid number of cards: 0")
+            if on_stream is not None:
+                on_stream(parser)
+
+        return validate
+
+    def _record_dialog(self, result):
+        """记录玩家对大家说的话"""
+        dialog = result[3]
+        if dialog:
+            self.player_dialog.append(f"{self.current_player}: {dialog}")
+        return result
+
+    def _report_failure(self, attempt, max_retry, error):
+        metrics.THINK_RETRIES.inc(style=self.player_status[self.current_player]["style"],
+                                  reason=error if isinstance(error, str) else type(error).__name__)
+        if attempt < max_retry:
+            print(f"Attempt {attempt + 1} failed: {error}. Retrying...")
+        else:
+            print(f"Failed after {max_retry} attempts. Giving up.")
+
+    def think(self, max_retry=3, on_stream=None):
+        """计算当前玩家的决策，不修改游戏状态，可以在后台线程中提前执行
+
+        Args:
+            max_retry (int): 最大重试次数
+            on_stream (Callable): 流式回调，每收到一段回复就以 `MarkdownJsonStreamParser` 调用一次，
+                可以在页面上实时显示思考内容
+        """
+        style = self.player_status[self.current_player]["style"]
+        with metrics.timer(metrics.THINK_SECONDS, style=style):
+            agent = self.player_status[self.current_player]["agent"]
+            if agent is None:
+                return self._policy_think()
+            route, decision = self._route()
+            if route == "dialog":
+                try:
+                    return self._with_dialog(decision, agent(self._get_think_msg(decision), on_stream=on_stream))
+                except ResponseParsingError as e:
+                    # 发言生成失败时不重试，直接使用角色策略的发言
+                    metrics.THINK_RETRIES.inc(style=style, reason=type(e).__name__)
+                    return decision
+            if decision is not None:
+                return decision
+            msg = self._get_think_msg()
+            validate = self._stream_validator(on_stream)
+            for attempt in range(max_retry + 1):  # +1 是因为range从0开始计数
+                try:
+                    # 重试时跳过缓存，避免重复拿到同一个不合法的回复
+                    return self._check_response(agent(msg, use_cache=attempt == 0, on_stream=validate))
+                except (GameError, ResponseParsingError) as e:
+                    self._report_failure(attempt, max_retry, e)
+            # 模型调用一直失败时改用规则策略
+            metrics.THINK_FALLBACKS.inc(style=style)
+            return self._policy_think()
+
+    def player_think(self, max_retry=3, on_stream=None):
+        return self._record_dialog(self.think(max_retry, on_stream))
+
+    async def aplayer_think(self, max_retry=3, timeout=None, semaphore=None, executor=None, on_stream=None):
+        """player_think 的异步版本，模型调用不会阻塞事件循环
+
+        Args:
+            max_retry (int): 最大重试次数
+            timeout (float): 每次模型调用的超时时间（秒），超时视为一次失败的尝试
+            semaphore (asyncio.Semaphore): 限制同时进行的模型调用数量，多个牌桌可共享同一个信号量
+            executor (concurrent.futures.Executor): 执行模型调用的线程池，默认使用事件循环的默认线程池
+            on_stream (Callable): 流式回调，在执行模型调用的线程中调用
+        """
+        style = self.player_status[self.current_player]["style"]
+        with metrics.timer(metrics.THINK_SECONDS, style=style):
+            agent = self.player_status[self.current_player]["agent"]
+            if agent is None:
+                return self._record_dialog(self._policy_think())
+            route, decision = self._route()
+            if route == "dialog":
+                try:
+                    response = await agent.areply(self._get_think_msg(decision), timeout=timeout, semaphore=semaphore,
+                                                  executor=executor, on_stream=on_stream)
+                    return self._record_dialog(self._with_dialog(decision, response))
+                except asyncio.TimeoutError:
+                    metrics.THINK_RETRIES.inc(style=style, reason="timeout")
+                except ResponseParsingError as e:
+                    metrics.THINK_RETRIES.inc(style=style, reason=type(e).__name__)
+                # 发言生成失败时不重试，直接使用角色策略的发言
+                return self._record_dialog(decision)
+            if decision is not None:
+                return self._record_dialog(decision)
+            msg = self._get_think_msg()
+            validate = self._stream_validator(on_stream)
+            for attempt in range(max_retry + 1):
+                try:
+                    response = await agent.areply(msg, timeout=timeout, semaphore=semaphore, executor=executor,
+                                                  use_cache=attempt == 0, on_stream=validate)
+                    return self._record_dialog(self._check_response(response))
+                except asyncio.TimeoutError:
+                    self._report_failure(attempt, max_retry, "timeout")
+                except (GameError, ResponseParsingError) as e:
+                    self._report_failure(attempt, max_retry, e)
+            # 模型调用一直失败时改用规则策略
+            metrics.THINK_FALLBACKS.inc(style=style)
+            return self._record_dialog(self._policy_think())
+
+    def _policy_think(self):
+        """规则策略的决策，没有绑定策略的角色使用随机策略（手牌打完时质疑）"""
+        policy = self.player_status[self.current_player].get("policy")
+        if policy is None:
+            # game.simulation 依赖本模块，在这里导入以避免循环导入
+            from game.simulation import random_policy
+            policy = random_policy
+        return policy(self)
 
     def current_player_is_user(self):
         return self.player_status[self.current_player]["style"] == "user"
 
+    @property
+    def current_round(self):
+        """本轮的出牌记录，与 current_game_logs 是同一份数据"""
+        return self.current_game_logs
+
+    @property
+    def total_rounds(self):
+        """已经结束的所有轮次的出牌记录"""
+        return list(self.game_logs.values())
+
     def _add_to_current_round(self, action, cards=None, thought=None, dialog=None):
         """添加当前轮次的玩家动作和卡牌"""
-        self.current_round.append({"player": self.current_player, "action": action, "cards": cards or []})
         self.current_game_logs.append(
             {"player": self.current_player, "action": action, "cards": cards or [], "thought": thought,
              "dialog": dialog})
+        self._game_logs_cache = [None, None]
 
     def turn_new_round(self):
         """结束当前轮次并开始新的一轮"""
-        self.round += 1
-        self.game_logs[self.round] = self.current_game_logs.copy()
-        self.total_rounds.append(self.current_round.copy())
-        self.current_round.clear()
-        self.current_game_logs.clear()
-        self.start_new_round()
+        self.start_new_round(self.round + 1)
+
+    def _archive_round(self, new_round):
+        """归档当前轮次的记录，直接移交列表而不复制"""
+        self.round = new_round
+        self.game_logs[self.round] = self.current_game_logs
+        self._last_round_log_view = self._round_log_view
+        self.current_game_logs = []
+        self._game_logs_cache = [None, None]
+
+    def _emit(self, event):
+        """把事件应用到游戏状态并追加到事件流，事件不合法时抛出 GameError，状态和事件流都不变"""
+        self._apply(event)
+        self.events.append(event)
+
+    def _apply(self, event):
+        getattr(self, f"_on_{event['type']}")(event)
+
+    def _on_start(self, event):
+        for player, style in zip(self.players, event["styles"]):
+            self.player_status[player]["style"] = style
+            self.player_status[player]["policy"] = personas.get_policy(style)
+
+    def _on_deal(self, event):
+        if event["round"] != self.round:
+            self._archive_round(event["round"])
+        self.target_card = event["target"]
+        self.player_cards = {player: list(cards) for player, cards in event["hands"].items()}
+        self._round_log_view = RoundLogView(self.current_game_logs, self.target_card)
+        self._round_context = RoundContext(self.context_policy, self.current_game_logs)
+        self._game_logs_cache = [None, None]
+
+    def _on_play(self, event):
+        # 先校验再修改状态，不合法的出牌不会留下任何记录
+        if not 0 < len(event["cards"]) <= MAX_PLAY or not self.check_played_cards(event["cards"]):
+            raise GameError(f"Invalid cards: {event['cards']}")
+        self._add_to_current_round(self.action_space[0], event["cards"], event.get("thought"), event.get("dialog"))
+        # 更新手里的牌
+        self.update_current_player_cards(event["cards"])
+        self.current_player = self._next_player(self.current_player)
+
+    def _on_challenge(self, event):
+        self._add_to_current_round(self.action_space[1], None, event.get("thought"), event.get("dialog"))
+        self.challenge_info.clear()
+        self._challenge_info_cache.clear()
+        if self.verbose:
+            print(f"{self.current_player} challenges!")
+        last_player_action = self.current_round[-2]
+        last_player = last_player_action["player"]
+        self.challenge_info.append(f"{self.current_player}质疑{last_player}")
+        self.challenge_info.append(
+            f"{last_player}的出牌为: {','.join(last_player_action['cards'])}, 本轮目标牌为: {self.target_card}")
+
+    def _on_punishment(self, event):
+        punished_player = event["player"]
+        self.challenge_info.append(
+            f"{self.current_player}质疑{'失败' if event['honest'] else '成功'}, {punished_player}将受到惩罚！")
+        # 被惩罚玩家出牌
+        self.current_player = punished_player
+        if not event["eliminated"]:
+            if self.verbose:
+                print(f"{punished_player} survives the challenge!")
+            self.player_status[punished_player]["elimination_factor"] -= 1
+            self.challenge_info.append(f"{punished_player}侥幸逃过一劫，游戏继续！")
+            self.challenge_info.append(f"{punished_player}请继续出牌！")
+
+    def _on_elimination(self, event):
+        punished_player = event["player"]
+        if self.verbose:
+            print(f"{punished_player} is eliminated!")
+        self.player_status[punished_player]["is_alive"] = False
+        # 出局则下一玩家出牌
+        self.current_player = self._next_player(punished_player)
+        self.challenge_info.append(f"{punished_player}不幸出局！")
+
+    @classmethod
+    def replay(cls, events, **kwargs):
+        """根据事件流重建游戏状态，不会重新抽取随机数
+
+        Args:
+            events (List[dict]): `Game.events` 或者从归档中读取的事件
+            **kwargs: 传给构造函数的参数
+        """
+        kwargs.setdefault("verbose", False)
+        game = cls(**kwargs)
+        for event in events:
+            game.events.append(event)
+            game._apply(event)
+        return game
 
     def get_current_round(self):
-        """获取当前轮次的信息"""
-        info = ""
-        for entry in self.current_game_logs:
-            if len(entry['cards']) == 0:
-                info += f"{entry['player']} 选择了质疑！"
-            else:
-                info += f"{entry['player']} play {len(entry['cards'])}张目标牌！"
-            if entry["dialog"]:
-                info += f"并且对大家说: {entry['dialog']}\n"
-            else:
-                info += "\n"
-        return info
+        """获取当前轮次的信息，按照 context_policy 截取和汇总"""
+        return self._round_context.render()
+
+    def set_context_policy(self, policy):
+        """切换上下文策略，当前轮次的记录会按照新的策略重新处理"""
+        self.context_policy = policy
+        self.player_dialog = deque(self.player_dialog, maxlen=policy.max_dialogs)
+        self._round_context = RoundContext(policy, self.current_game_logs)
 
     def get_game_logs(self, debug=False):
+        """获取出牌记录的HTML，记录没有变化时直接返回缓存"""
+        debug = int(bool(debug))
+        cached = self._game_logs_cache[debug]
+        if cached is not None:
+            return cached
         info = "本轮次：\n"
-        info += self._get_logs_info(self.current_game_logs, debug)
+        info += self._round_log_view.render(debug)
         if len(self.game_logs) > 0:
             info += "\n上一轮次: \n"
-            max_key = max(self.game_logs.keys())
-            info += self._get_logs_info(self.game_logs[max_key], debug)
-        return info
-
-    def _get_logs_info(self, game_logs, debug=False):
-        # 使用不同的颜色定义每条记录
-        colors = ["#FF5733", "#33FF57", "#3357FF", "#FF33A1", "#C70039"]  # 示例颜色列表
-        color_index = 0  # 用于循环选择颜色
-        info = "<div>"
-        for entry in game_logs:
-            # 选择颜色，并确保颜色索引在有效范围内循环
-            color = colors[color_index % len(colors)]
-            color_index += 1
-
-            # 构建基础信息
-            if len(entry['cards']) == 0:
-                log_info = f"<span style='color:{color}'>{entry['player']}选择了质疑!<br></span>"
-            else:
-                log_info = f"<span style='color:{color}'>{entry['player']} play {len(entry['cards'])}张目标牌{self.target_card}<br></span>"
-
-            # 如果有对话，则添加到log_info
-            if entry['dialog']:
-                log_info += f"<span style='color:{color}'>{entry['player']} say: {entry['dialog']}<br></span>"
-
-            # 如果是调试模式且有思考内容，则添加到log_info
-            if debug and entry['thought']:
-                log_info += f"<span style='color:{color}'>{entry['player']} thought: {entry['thought']}<br></span>"
-
-            # 将当前记录添加到总信息中
-            info += log_info
-        info += "</div>"
+            info += self._last_round_log_view.render(debug)
+        self._game_logs_cache[debug] = info
         return info
 
     def get_challenge_info(self, html_format=True):
+        cached = self._challenge_info_cache.get(html_format)
+        if cached is not None:
+            return cached
         if html_format:
             txt = "\n".join(self.challenge_info)
-            return f"```\n{txt}\n```"
+            info = f"```\n{txt}\n```"
         else:
-            return "\n".join(self.challenge_info)
+            info = "\n".join(self.challenge_info)
+        self._challenge_info_cache[html_format] = info
+        return info
 
     def get_game_info(self):
         info = ""
@@ -249,19 +563,17 @@ class Game:
             current_cards.remove(card)
         self.player_cards[self.current_player] = current_cards
 
-    def start_new_round(self):
-        """开始新游戏"""
-        # 使用当前时间作为随机数生成器的种子，确保每次运行时生成的随机数序列不同
-        random.seed(time.time())
-        self.target_card = random.choice(self.total_cards)
-        # 添加两张目标卡牌
-        self.total_cards.extend([self.target_card, self.target_card])
-        random.shuffle(self.total_cards)
+    def _deal(self):
+        """选择目标牌并发牌，返回目标牌和每个玩家的手牌"""
+        # 选择目标牌，两张万能牌替换为目标牌后洗牌
+        target_card = self.deck.new_round(self.rng)
         # 分发卡牌给每个玩家
-        for i, player in enumerate(self.players):
-            start_index = i * 5
-            end_index = start_index + 5
-            self.player_cards[player] = self.total_cards[start_index:end_index]
+        return target_card, {player: self.deck.deal(i) for i, player in enumerate(self.players)}
+
+    def start_new_round(self, round=None):
+        """开始新游戏"""
+        target_card, hands = self._deal()
+        self._emit({"type": ev.DEAL, "round": round or self.round, "target": target_card, "hands": hands})
 
     def is_over(self):
         """检查游戏是否结束, user玩家出局或者产生最后一名玩家则结束"""
@@ -280,7 +592,7 @@ class Game:
 
     def _eliminate_check(self, player):
         """检查玩家是否被淘汰"""
-        select = random.randint(1, self.player_status[player]["elimination_factor"])
+        select = self.rng.randint(1, self.player_status[player]["elimination_factor"])
         return select == 1
 
     def get_winner(self):
@@ -302,42 +614,29 @@ class Game:
 
     def play(self, action, cards=None, thought=None, dialog=None):
         """执行玩家动作"""
-        self._add_to_current_round(action, cards, thought, dialog)
         # 正常出牌则轮到下一个玩家出牌
         if action == self.action_space[1]:
-            self.challenge_info.clear()
-            print(f"{self.current_player} challenges!")
-            last_player_action = self.current_round[-2]
+            if not self.current_round:
+                raise GameError("First player of a round can not challenge")
+            last_player_action = self.current_round[-1]
             last_player = last_player_action["player"]
             last_player_cards = last_player_action["cards"]
-            self.challenge_info.append(f"{self.current_player}质疑{last_player}")
+            self._emit({"type": ev.CHALLENGE, "player": self.current_player, "thought": thought, "dialog": dialog})
             # 质疑是否为目标牌
             all_target_cards = all(card == self.target_card for card in last_player_cards)
-            self.challenge_info.append(
-                f"{last_player}的出牌为: {','.join(last_player_cards)}, 本轮目标牌为: {self.target_card}")
             # 惩罚玩家
             punished_player = self.current_player if all_target_cards else last_player
-            self.challenge_info.append(
-                f"{self.current_player}质疑{'失败' if all_target_cards else '成功'}, {punished_player}将受到惩罚！")
-            # 被惩罚玩家出牌
-            self.current_player = punished_player
-            if self._eliminate_check(punished_player):
-                print(f"{punished_player} is eliminated!")
-                self.player_status[punished_player]["is_alive"] = False
-                # 出局则下一玩家出牌
-                self.current_player = self._next_player(punished_player)
-                self.challenge_info.append(f"{punished_player}不幸出局！")
-            else:
-                print(f"{punished_player} survives the challenge!")
-                self.player_status[punished_player]["elimination_factor"] -= 1
-                self.challenge_info.append(f"{punished_player}侥幸逃过一劫，游戏继续！")
-                self.challenge_info.append(f"{punished_player}请继续出牌！")
+            eliminated = self._eliminate_check(punished_player)
+            self._emit({"type": ev.PUNISHMENT, "player": punished_player, "honest": all_target_cards,
+                        "eliminated": eliminated})
+            if eliminated:
+                self._emit({"type": ev.ELIMINATION, "player": punished_player})
 
             # 结束当前轮次
             self.turn_new_round()
             return all_target_cards, last_player_cards, punished_player, self.player_status[punished_player]["is_alive"]
         else:
-            # 更新手里的牌
-            self.update_current_player_cards(cards)
-            self.current_player = self._next_player(self.current_player)
+            # 卡牌统一为大写，与手牌一致
+            self._emit({"type": ev.PLAY, "player": self.current_player, "cards": [card.upper() for card in cards],
+                        "thought": thought, "dialog": dialog})
             return None, None, None, None
@@ -0,0 +1,121 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import argparse
+import os
+from math import comb
+
+import numpy as np
+
+from game.compact_state import ENTRY_SIZE, NUM_TYPES, TRUST
+from game.deck import CARDS_PER_TYPE, DECK_SIZE, HAND_SIZE, MAX_PLAY, WILDCARDS
+
+# 每轮目标牌的数量：本牌型加上替换为目标牌的万能牌
+TARGET_CARDS = CARDS_PER_TYPE + WILDCARDS
+# 离线计算好的概率表，可以用 `python -m game.honesty_table` 重新生成
+TABLE_PATH = os.environ.get("LIAR_BAR_HONESTY_TABLE",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), "honesty_table.npy"))
+TABLE_SHAPE = (HAND_SIZE + 1, HAND_SIZE, MAX_PLAY + 1)
+
+_table = None
+
+
+def build_table():
+    """枚举所有状态，计算上家本轮的出牌可能全部为真的精确概率。
+
+    table[mine, claimed, num]：当前玩家本轮发到 mine 张目标牌（手里的加上本轮已经打出的），
+    上家此前本轮已经出了 claimed 张牌，最后一次出了 num 张。除自己的手牌以外的
+    DECK_SIZE - HAND_SIZE 张牌随机分配给其他座位，上家的初始手牌中至少有 claimed + num 张目标牌的
+    超几何概率。玩家优先打出真牌时，这就是上家最后一次出牌全部为目标牌的概率。
+    不可能出现的状态（出牌总数超过手牌数量）为0。
+    """
+    unseen = DECK_SIZE - HAND_SIZE
+    total = comb(unseen, HAND_SIZE)
+    table = np.zeros(TABLE_SHAPE, dtype=np.float64)
+    for mine in range(HAND_SIZE + 1):
+        remaining = TARGET_CARDS - mine
+        # 上家初始手牌中恰好有 t 张目标牌的概率
+        exact = [comb(remaining, t) * comb(unseen - remaining, HAND_SIZE - t) / total
+                 for t in range(HAND_SIZE + 1)]
+        for claimed in range(HAND_SIZE):
+            for num in range(1, min(MAX_PLAY, HAND_SIZE - claimed) + 1):
+                table[mine, claimed, num] = sum(exact[claimed + num:])
+    return table
+
+
+def save_table(path=TABLE_PATH):
+    """重新计算概率表并写入 path"""
+    table = build_table()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, table)
+    os.replace(tmp_path, path)
+    return table
+
+
+def load_table(path=TABLE_PATH):
+    """以内存映射方式加载概率表，文件不存在或者与当前牌组规则不一致时在内存中重新计算"""
+    global _table
+    if _table is None:
+        table = None
+        if os.path.exists(path):
+            table = np.load(path, mmap_mode="r")
+            if table.shape != TABLE_SHAPE:
+                table = None
+        _table = build_table() if table is None else table
+    return _table
+
+
+def lookup(mine, claimed, num):
+    """O(1) 查表，参数含义见 `build_table`"""
+    return float(load_table()[mine, claimed, num])
+
+
+def probability_last_play_honest(game):
+    """当前玩家视角下，上家最后一次出牌全部为目标牌的概率，本轮还没有人出牌时返回None"""
+    if not game.current_round:
+        return None
+    last = game.current_round[-1]
+    previous = last["player"]
+    target = game.target_card
+    me = game.current_player
+    mine = sum(1 for card in game.player_cards[me] if card == target)
+    claimed = 0
+    for entry in game.current_round[:-1]:
+        if entry["action"] != game.action_space[0]:
+            continue
+        if entry["player"] == me:
+            mine += sum(1 for card in entry["cards"] if card == target)
+        elif entry["player"] == previous:
+            claimed += len(entry["cards"])
+    return lookup(mine, claimed, len(last["cards"]))
+
+
+def probability_from_state(state):
+    """CompactState 版本的 `probability_last_play_honest`，供模拟和搜索使用"""
+    if not state.history_len:
+        return None
+    history = state.history
+    target = state.target
+    me = state.current
+    last = (state.history_len - 1) * ENTRY_SIZE
+    previous = history[last]
+    mine = state.hands[me * NUM_TYPES + target]
+    claimed = 0
+    for offset in range(0, last, ENTRY_SIZE):
+        if history[offset + 1] != TRUST:
+            continue
+        if history[offset] == me:
+            mine += history[offset + 2 + target]
+        elif history[offset] == previous:
+            claimed += history[offset + 2] + history[offset + 3] + history[offset + 4]
+    return lookup(mine, claimed, history[last + 2] + history[last + 3] + history[last + 4])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线计算上家出牌全部为目标牌的概率表")
+    parser.add_argument("-o", "--output", default=TABLE_PATH)
+    args = parser.parse_args()
+    table = save_table(args.output)
+    print(f"saved {table.shape} table to {args.output}")
+    for mine in range(HAND_SIZE + 1):
+        print(f"mine={mine}, claimed=0, num=1..{MAX_PLAY}: {np.round(table[mine, 0, 1:], 4)}")
@@ -0,0 +1,126 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import argparse
+import time
+
+import numpy as np
+
+from game.compact_state import MAX_ELIMINATION_FACTOR
+from game.deck import HAND_SIZE
+
+
+def _per_player(value, num_players, dtype):
+    """把标量或列表参数扩展为每个玩家一个值"""
+    array = np.asarray(value, dtype=dtype)
+    return np.broadcast_to(array, (num_players,)).copy()
+
+
+def _next_alive(alive, games, players):
+    """向量化的 Game._next_player：返回每局中 players 之后的下一个存活玩家"""
+    num_players = alive.shape[1]
+    candidates = (players[:, None] + np.arange(1, num_players + 1)) % num_players
+    first = np.argmax(alive[games[:, None], candidates], axis=1)
+    return candidates[np.arange(len(players)), first]
+
+
+def simulate(n_games, challenge_rate=0.3, lie_rate=0.3, max_play=3, num_players=4, seed=None):
+    """同时模拟 n_games 局游戏的轮转和“左轮手枪”淘汰机制，所有状态都是 (对局 × 玩家) 的数组
+
+    每位玩家的策略用三个参数描述，可以是标量（所有玩家相同）或长度为 num_players 的列表：
+    有上家出牌时质疑的概率、出牌中夹带假牌的概率、每次最多出牌数量。手牌打完的玩家只能质疑。
+    出牌、质疑、惩罚、淘汰以及新一轮由谁先出牌都与 Game.play 的规则一致。
+
+    Args:
+        n_games (int): 对局数量
+        challenge_rate (float | List[float]): 质疑概率
+        lie_rate (float | List[float]): 出假牌的概率
+        max_play (int | List[int]): 每次最多出牌数量（1至3）
+        num_players (int): 玩家数量
+        seed (int): 随机种子
+
+    Returns:
+        dict: win_rate 每个座位的胜率；survival 第r轮结束后每个座位的存活率；
+            elimination_rate 每个座位的出局率；rounds / turns 每局的轮数和行动次数；
+            mean_rounds / mean_turns 平均游戏长度
+    """
+    rng = np.random.default_rng(seed)
+    challenge_rate = _per_player(challenge_rate, num_players, np.float64)
+    lie_rate = _per_player(lie_rate, num_players, np.float64)
+    max_play = _per_player(max_play, num_players, np.int8)
+
+    alive = np.ones((n_games, num_players), dtype=bool)
+    factors = np.full((n_games, num_players), MAX_ELIMINATION_FACTOR, dtype=np.int8)
+    hands = np.full((n_games, num_players), HAND_SIZE, dtype=np.int8)
+    eliminated_round = np.full((n_games, num_players), -1, dtype=np.int32)
+    current = np.zeros(n_games, dtype=np.int64)
+    last_player = np.full(n_games, -1, dtype=np.int64)
+    last_lie = np.zeros(n_games, dtype=bool)
+    rounds = np.zeros(n_games, dtype=np.int32)
+    turns = np.zeros(n_games, dtype=np.int32)
+    active = np.arange(n_games)
+
+    while len(active):
+        players = current[active]
+        hand = hands[active, players]
+        challenge = (last_player[active] >= 0) & (
+            (hand == 0) | (rng.random(len(active)) < challenge_rate[players]))
+        turns[active] += 1
+
+        # 出牌：打出1至max_play张牌，按概率夹带假牌，然后轮到下一个存活玩家
+        games = active[~challenge]
+        if len(games):
+            players = current[games]
+            limit = np.minimum(max_play[players], hands[games, players]).astype(np.int64)
+            hands[games, players] -= rng.integers(1, limit + 1).astype(np.int8)
+            last_lie[games] = rng.random(len(games)) < lie_rate[players]
+            last_player[games] = players
+            current[games] = _next_alive(alive, games, players)
+
+        # 质疑：撒谎的一方受罚，以 1/elimination_factor 的概率出局，否则子弹减少一发，然后开始新的一轮
+        games = active[challenge]
+        if len(games):
+            punished = np.where(last_lie[games], last_player[games], current[games])
+            rounds[games] += 1
+            out = rng.random(len(games)) * factors[games, punished] < 1
+            survived = games[~out]
+            factors[survived, punished[~out]] -= 1
+            current[survived] = punished[~out]
+            dead = games[out]
+            alive[dead, punished[out]] = False
+            eliminated_round[dead, punished[out]] = rounds[dead]
+            current[dead] = _next_alive(alive, dead, punished[out])
+            hands[games] = HAND_SIZE
+            last_player[games] = -1
+
+        active = active[alive[active].sum(axis=1) > 1]
+
+    max_rounds = int(rounds.max()) if n_games else 0
+    survival = np.stack([((eliminated_round < 0) | (eliminated_round > r)).mean(axis=0)
+                         for r in range(max_rounds + 1)])
+    return {
+        "win_rate": alive.mean(axis=0),
+        "survival": survival,
+        "elimination_rate": 1 - alive.mean(axis=0),
+        "rounds": rounds,
+        "turns": turns,
+        "mean_rounds": float(rounds.mean()) if n_games else 0.0,
+        "mean_turns": float(turns.mean()) if n_games else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="向量化模拟左轮手枪淘汰机制")
+    parser.add_argument("-n", "--games", type=int, default=1_000_000)
+    parser.add_argument("--challenge-rate", type=float, nargs="+", default=[0.3])
+    parser.add_argument("--lie-rate", type=float, nargs="+", default=[0.3])
+    parser.add_argument("--max-play", type=int, nargs="+", default=[3])
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    result = simulate(args.games, args.challenge_rate, args.lie_rate, args.max_play, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"games: {args.games}, elapsed: {elapsed:.2f}s, games/sec: {args.games / elapsed:.0f}")
+    print(f"mean rounds: {result['mean_rounds']:.2f}, mean turns: {result['mean_turns']:.2f}")
+    print(f"win rate by seat: {np.round(result['win_rate'], 4)}")
+    for r, survival in enumerate(result["survival"][:12]):
+        print(f"after round {r}: {np.round(survival, 4)}")
@@ -0,0 +1,254 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import argparse
+import random
+import time
+from collections import Counter
+
+from game import events as ev
+from game.compact_state import CHALLENGE, NUM_TYPES, TRUST, CompactState
+from game.game import Game, GameError
+from instrumentation import metrics
+from policies import personas
+
+DEFAULT_STYLES = ["coward", "augur", "bold_gambler", "cool_analyzer"]
+
+
+def random_policy(game):
+    """随机策略：有上家出牌时以30%概率质疑，否则随机打出1至3张手牌"""
+    cards = game.player_cards[game.current_player]
+    if game.current_round and (not cards or game.rng.random() < 0.3):
+        return game.action_space[1], None, None, None
+    num = game.rng.randint(1, min(3, len(cards)))
+    return game.action_space[0], game.rng.sample(cards, num), None, None
+
+
+def random_policy_factory(style):
+    """默认的策略工厂，所有风格都使用随机策略"""
+    return random_policy
+
+
+def persona_policy_factory(style):
+    """内置角色使用 policies.personas 中对应的规则策略，其余角色使用随机策略"""
+    return personas.get_policy(style) or random_policy
+
+
+class SimulationStats:
+    """批量模拟的统计结果"""
+
+    def __init__(self):
+        self.games = 0
+        self.moves = 0
+        self.rounds = 0
+        self.elapsed = 0.0
+        self.wins = Counter()
+        self.seat_wins = Counter()
+        self.eliminations = Counter()
+        self.appearances = Counter()
+
+    @property
+    def games_per_sec(self):
+        return self.games / self.elapsed if self.elapsed > 0 else 0.0
+
+    def win_rates(self):
+        """按风格统计胜率（胜场 / 出场次数）"""
+        return {style: self.wins[style] / count for style, count in self.appearances.items()}
+
+    def record(self, game, moves):
+        """记录一局结束后的游戏结果"""
+        self.games += 1
+        self.moves += moves
+        self.rounds += game.round
+        winner = game.get_winner()
+        self.wins[game.player_status[winner]["style"]] += 1
+        self.seat_wins[winner] += 1
+        for player, status in game.player_status.items():
+            self.appearances[status["style"]] += 1
+            if not status["is_alive"]:
+                self.eliminations[status["style"]] += 1
+
+    def merge(self, other):
+        """合并另一份统计结果"""
+        self.games += other.games
+        self.moves += other.moves
+        self.rounds += other.rounds
+        self.elapsed += other.elapsed
+        self.wins.update(other.wins)
+        self.seat_wins.update(other.seat_wins)
+        self.eliminations.update(other.eliminations)
+        self.appearances.update(other.appearances)
+        return self
+
+    def summary(self):
+        lines = [f"games: {self.games}, moves: {self.moves}, rounds: {self.rounds}, "
+                 f"elapsed: {self.elapsed:.2f}s, games/sec: {self.games_per_sec:.0f}"]
+        for style, rate in sorted(self.win_rates().items()):
+            lines.append(f"{style}: win rate {rate:.3f}, eliminations {self.eliminations[style]}")
+        return "\n".join(lines)
+
+
+def new_game(styles, seed=None, game_class=Game):
+    """创建一局不依赖智能体的游戏，并发好第一轮的牌"""
+    game = game_class(seed=seed, verbose=False)
+    game.initialize_players(styles)
+    game.start_new_round()
+    return game
+
+
+def play_game(game, policies):
+    """用给定的策略把游戏进行到结束，返回总行动次数
+
+    Args:
+        game (Game): 已发牌的游戏
+        policies (dict): 玩家到策略的映射，策略签名与 `Game.player_think` 的返回值一致:
+            policy(game) -> (action, cards, thought, dialog)
+    """
+    moves = 0
+    while not game.is_over():
+        action, cards, thought, dialog = policies[game.current_player](game)
+        if action not in game.action_space:
+            raise GameError(f"Invalid action: {action}")
+        if action == game.action_space[1]:
+            if not game.current_round:
+                raise GameError("First player of a round can not challenge")
+        elif not cards or not game.check_played_cards(cards):
+            raise GameError(f"Invalid cards: {cards}")
+        game.play(action, cards, thought, dialog)
+        moves += 1
+    return moves
+
+
+def run_games(n, styles=None, policy_factory=None, seed=None, game_class=Game, event_writer=None):
+    """无界面地连续进行n局游戏，统计各角色的胜率和出局情况
+
+    Args:
+        n (int): 对局数量
+        styles (List[str]): 每个座位的角色风格，默认使用 `DEFAULT_STYLES`
+        policy_factory (Callable): 根据风格创建策略的工厂函数，默认使用随机策略
+        seed (int): 随机种子，相同的种子会得到相同的统计结果
+        game_class (type): 游戏类，可以替换为 `game.compact_game.CompactGame`；CompactGame 为了保持 Game 的接口
+            需要在手牌和字典视图之间转换，并不比 Game 快，大批量模拟请使用 `run_compact_games`
+        event_writer (game.events.EventWriter): 把每局游戏的事件写入归档，之后可以用 `replay_games` 重新统计
+    """
+    styles = styles or DEFAULT_STYLES
+    policy_factory = policy_factory or random_policy_factory
+    policies = {player: policy_factory(style) for player, style in zip(Game().players, styles)}
+    seeds = random.Random(seed)
+    stats = SimulationStats()
+    start = time.perf_counter()
+    for index in range(n):
+        game = new_game(styles, seed=seeds.getrandbits(64), game_class=game_class)
+        stats.record(game, play_game(game, policies))
+        if event_writer is not None:
+            event_writer.append(game.events, game_id=index)
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def replay_games(path, game_class=Game):
+    """读取 `EventWriter` 写入的归档，逐局重放并统计，不会重新抽取随机数
+
+    Args:
+        path (str): 归档目录或单个分段文件
+        game_class (type): 重放使用的游戏类
+    """
+    stats = SimulationStats()
+    start = time.perf_counter()
+    for _, events in ev.read_events(path):
+        game = game_class.replay(events)
+        stats.record(game, sum(1 for event in events if event["type"] in (ev.PLAY, ev.CHALLENGE)))
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def random_compact_policy(state):
+    """random_policy 在紧凑状态上的版本，返回 (action, a, k, q)"""
+    random = state.rng.random
+    base = state.current * NUM_TYPES
+    hands = state.hands
+    a, k = hands[base], hands[base + 1]
+    size = a + k + hands[base + 2]
+    if state.history_len and (not size or random() < 0.3):
+        return CHALLENGE, 0, 0, 0
+    # 不放回地逐张抽取，只统计每种牌的数量，不需要构造手牌列表
+    played_a = played_k = played_q = 0
+    for remaining in range(size, size - 1 - int(random() * min(3, size)), -1):
+        index = int(random() * remaining)
+        if index < a:
+            a -= 1
+            played_a += 1
+        elif index < a + k:
+            k -= 1
+            played_k += 1
+        else:
+            played_q += 1
+    return TRUST, played_a, played_k, played_q
+
+
+def run_compact_games(n, styles=None, policy=None, seed=None):
+    """使用 CompactState 进行n局模拟，策略直接读取紧凑状态，出牌过程几乎不分配对象
+
+    Args:
+        n (int): 对局数量
+        styles (List[str]): 每个座位的角色风格，只用于统计
+        policy (Callable): policy(state) -> (action, a, k, q)，默认使用随机策略
+        seed (int): 随机种子
+    """
+    styles = styles or DEFAULT_STYLES
+    policy = policy or random_compact_policy
+    seeds = random.Random(seed)
+    stats = SimulationStats()
+    start = time.perf_counter()
+    for _ in range(n):
+        state = CompactState(len(styles), seed=seeds.getrandbits(64))
+        state.deal()
+        moves = 0
+        while not state.is_over():
+            action, a, k, q = policy(state)
+            if action == CHALLENGE:
+                if not state.history_len:
+                    raise GameError("First player of a round can not challenge")
+                state.challenge()
+            elif a + k + q == 0 or not state.can_play(a, k, q):
+                raise GameError(f"Invalid cards: {(a, k, q)}")
+            else:
+                state.play(a, k, q)
+            moves += 1
+        stats.games += 1
+        stats.moves += moves
+        stats.rounds += state.round
+        stats.wins[styles[state.winner()]] += 1
+        stats.seat_wins[f"player{state.winner() + 1}"] += 1
+        for player, style in enumerate(styles):
+            stats.appearances[style] += 1
+            if not state.alive[player]:
+                stats.eliminations[style] += 1
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="无界面批量模拟骗子酒馆游戏")
+    parser.add_argument("-n", "--games", type=int, default=10000)
+    parser.add_argument("--styles", nargs=4, default=DEFAULT_STYLES)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--compact", action="store_true", help="使用紧凑状态进行模拟")
+    parser.add_argument("--personas", action="store_true", help="使用角色的规则策略代替随机策略")
+    parser.add_argument("--metrics-json", default=None, help="把耗时等指标写入JSON文件")
+    parser.add_argument("--archive", default=None, help="把每局游戏的事件写入该目录")
+    parser.add_argument("--replay", default=None, help="重放归档目录中的游戏并统计，不再进行模拟")
+    args = parser.parse_args()
+    if args.replay:
+        print(replay_games(args.replay).summary())
+    elif args.compact:
+        print(run_compact_games(args.games, args.styles, seed=args.seed).summary())
+    else:
+        policy_factory = persona_policy_factory if args.personas else None
+        if args.archive:
+            with ev.EventWriter(args.archive) as writer:
+                stats = run_games(args.games, args.styles, policy_factory, seed=args.seed, event_writer=writer)
+        else:
+            stats = run_games(args.games, args.styles, policy_factory, seed=args.seed)
+        print(stats.summary())
+    if args.metrics_json:
+        metrics.REGISTRY.dump_json(args.metrics_json)
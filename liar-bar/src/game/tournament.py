@@ -0,0 +1,80 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import argparse
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from game.simulation import SimulationStats, persona_policy_factory, random_policy_factory, run_games
+from policies.personas import BUILTIN_STYLES
+
+
+def get_matchups(styles=None, seats=4):
+    """生成所有对阵组合，每个组合从内置角色中选出 seats 个不同角色"""
+    return list(itertools.combinations(styles or BUILTIN_STYLES, seats))
+
+
+def shard_seed(seed, matchup_index, shard_index):
+    """为每个分片生成确定的随机种子，结果与进程数量无关"""
+    return random.Random(f"{seed}:{matchup_index}:{shard_index}").getrandbits(64)
+
+
+def _run_shard(args):
+    matchup_index, styles, n, seed, policy_factory = args
+    return matchup_index, run_games(n, list(styles), policy_factory, seed)
+
+
+def run_tournament(games_per_matchup, matchups=None, policy_factory=None, seed=0, workers=None, shard_size=1000):
+    """把每个对阵组合的对局切分成分片，分发到多个进程中并行模拟，最后合并统计结果
+
+    Args:
+        games_per_matchup (int): 每个对阵组合的对局数量
+        matchups (List[Tuple[str]]): 对阵组合，默认使用 `get_matchups()`
+        policy_factory (Callable): 策略工厂，必须是可以被pickle的模块级函数，默认使用各角色的规则策略，
+            传入 `random_policy_factory` 时所有角色都使用同一个随机策略，可以作为对照
+        seed (int): 随机种子，相同的种子和分片大小总能得到相同的结果
+        workers (int): 进程数量，默认为CPU核数
+        shard_size (int): 每个分片的对局数量
+
+    Returns:
+        Tuple[dict, SimulationStats]: 每个对阵组合的统计结果，以及所有对局的汇总结果
+    """
+    matchups = matchups or get_matchups()
+    policy_factory = policy_factory or persona_policy_factory
+    tasks = []
+    for matchup_index, styles in enumerate(matchups):
+        for shard_index, start in enumerate(range(0, games_per_matchup, shard_size)):
+            n = min(shard_size, games_per_matchup - start)
+            tasks.append((matchup_index, styles, n, shard_seed(seed, matchup_index, shard_index), policy_factory))
+
+    results = {tuple(styles): SimulationStats() for styles in matchups}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for matchup_index, stats in executor.map(_run_shard, tasks):
+            results[tuple(matchups[matchup_index])].merge(stats)
+
+    total = SimulationStats()
+    for stats in results.values():
+        total.merge(stats)
+    # 汇总结果使用实际耗时，以便反映多进程下的吞吐量
+    total.elapsed = time.perf_counter() - start
+    return results, total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多进程锦标赛模式")
+    parser.add_argument("-n", "--games", type=int, default=10000, help="每个对阵组合的对局数量")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--random", action="store_true", help="所有角色都使用随机策略，作为规则策略的对照")
+    args = parser.parse_args()
+    policy_factory = random_policy_factory if args.random else persona_policy_factory
+    per_matchup, summary = run_tournament(args.games, policy_factory=policy_factory, seed=args.seed,
+                                          workers=args.workers)
+    for matchup, stats in per_matchup.items():
+        print(f"== {' vs '.join(matchup)}")
+        print(stats.summary())
+    print("== total")
+    print(summary.summary())
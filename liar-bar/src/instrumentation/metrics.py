@@ -0,0 +1,255 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 秒级耗时的默认分桶，覆盖从本地逻辑到大模型调用的范围
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# token 数量的分桶
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value, quote=True):
+    """按照 Prometheus 文本格式转义反斜杠、换行，标签值中还要转义双引号"""
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quote else value
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """只增不减的计数器，导出时样本名称带有 _total 后缀"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.family = f"{name}_total"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.values)
+        for key, value in values.items():
+            yield f"{self.family}{_format_labels(self.labelnames, key)} {value}"
+
+    def to_dict(self):
+        with self._lock:
+            return [{"labels": dict(zip(self.labelnames, key)), "value": value} for key, value in self.values.items()]
+
+
+class Histogram:
+    """累积分桶的直方图，与 Prometheus 的 histogram 语义一致"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.family = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [每个分桶的计数（最后一个为 +Inf）, 总和, 次数]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def get(self, **labels):
+        """返回 (次数, 总和)"""
+        state = self.values.get(_label_key(self.labelnames, labels))
+        return (state[2], state[1]) if state else (0, 0.0)
+
+    def _snapshot(self):
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self.values.items()}
+
+    def samples(self):
+        for key, (counts, total, count) in self._snapshot().items():
+            cumulative = 0
+            for bound, num in zip(self.buckets + ("+Inf",), counts):
+                cumulative += num
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+    def to_dict(self):
+        result = []
+        for key, (counts, total, count) in self._snapshot().items():
+            result.append({
+                "labels": dict(zip(self.labelnames, key)),
+                "count": count,
+                "sum": total,
+                "mean": total / count if count else 0.0,
+                "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], counts)),
+            })
+        return result
+
+
+class Registry:
+    """指标注册表，同名指标只会创建一次"""
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.type}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def to_prometheus(self):
+        """Prometheus 文本格式，HELP 和 TYPE 使用与样本一致的名称"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.family} {_escape(metric.documentation, quote=False)}")
+            lines.append(f"# TYPE {metric.family} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        return {name: {"type": metric.type, "help": metric.documentation, "values": metric.to_dict()}
+                for name, metric in list(self.metrics.items())}
+
+    def dump_json(self, path):
+        """把所有指标写入 JSON 文件，先写临时文件再替换，避免读到写了一半的文件"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.time(), "metrics": self.to_dict()}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+
+REGISTRY = Registry()
+
+# 一次 player_think 的总耗时（包含重试）
+THINK_SECONDS = REGISTRY.histogram("liar_bar_think_seconds", "Wall time of one player decision", ("style",))
+THINK_RETRIES = REGISTRY.counter("liar_bar_think_retries", "Failed decision attempts", ("style", "reason"))
+THINK_FALLBACKS = REGISTRY.counter("liar_bar_think_fallbacks", "Decisions replaced by the fallback play",
+                                   ("style",))
+# AI玩家的决策方式：model 为调用模型决策，dialog 为本地决策后调用模型生成发言，其余为本地决策的原因
+ROUTED_DECISIONS = REGISTRY.counter("liar_bar_routed_decisions", "AI decisions by route", ("style", "route"))
+# 一次模型调用的耗时、首个token的耗时以及估算的token数
+MODEL_CALL_SECONDS = REGISTRY.histogram("liar_bar_model_call_seconds", "Wall time of one agent reply",
+                                        ("agent", "cached"))
+MODEL_TTFT_SECONDS = REGISTRY.histogram("liar_bar_model_ttft_seconds", "Time to the first streamed chunk",
+                                        ("agent",))
+PROMPT_TOKENS = REGISTRY.histogram("liar_bar_prompt_tokens", "Estimated prompt tokens per call", ("agent",),
+                                   TOKEN_BUCKETS)
+COMPLETION_TOKENS = REGISTRY.histogram("liar_bar_completion_tokens", "Estimated completion tokens per call",
+                                       ("agent",), TOKEN_BUCKETS)
+PARSE_SECONDS = REGISTRY.histogram("liar_bar_parse_seconds", "Time spent parsing a model response", ("agent",))
+# 牌桌管理器中一次行动的耗时，游戏引擎本身不计时，避免拖慢离线模拟
+PLAY_SECONDS = REGISTRY.histogram("liar_bar_play_seconds", "Time spent applying one action", ("action",))
+RENDER_SECONDS = REGISTRY.histogram("liar_bar_render_seconds", "Time spent rendering a page", ("page",))
+
+
+@contextmanager
+def timer(histogram, **labels):
+    """统计代码块的耗时，异常退出时同样记录"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(self.registry.to_dict(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        elif self.path.startswith("/metrics"):
+            body = self.registry.to_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port=9108, addr="127.0.0.1", registry=REGISTRY):
+    """在后台线程中启动指标服务：/metrics 为 Prometheus 文本格式，/metrics.json 为 JSON。
+    同一进程中重复调用会返回已经启动的服务，Streamlit 每次重新运行页面时都可以放心调用。"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+            _server = ThreadingHTTPServer((addr, port), handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
+
+
+_dump_registered = False
+
+
+def start_from_env(registry=REGISTRY):
+    """按照环境变量开启导出：LIAR_BAR_METRICS_PORT 启动指标服务，
+    LIAR_BAR_METRICS_FILE 在进程退出时把指标写入 JSON 文件"""
+    global _dump_registered
+    port = os.environ.get("LIAR_BAR_METRICS_PORT")
+    if port:
+        start_http_server(int(port), os.environ.get("LIAR_BAR_METRICS_ADDR", "127.0.0.1"), registry)
+    path = os.environ.get("LIAR_BAR_METRICS_FILE")
+    if path and not _dump_registered:
+        _dump_registered = True
+        atexit.register(registry.dump_json, path)
@@ -0,0 +1,174 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import json
+import os
+import random
+import threading
+import time
+
+import agentscope
+from agentscope.manager import ModelManager
+
+from instrumentation import metrics
+
+RATE_LIMITED = metrics.REGISTRY.counter("liar_bar_model_rate_limited", "Model calls rejected with HTTP 429",
+                                        ("model",))
+QUEUE_SECONDS = metrics.REGISTRY.histogram("liar_bar_model_queue_seconds", "Time a model call waited for a slot",
+                                           ("model",))
+
+
+def _rate_limit_delay(error):
+    """模型调用被限流时返回服务端建议的等待时间（没有则为0），不是限流错误时返回None"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except ValueError:
+        return 0.0
+
+
+class PooledModel:
+    """所有智能体共享的模型包装器。
+
+    同时进行的调用数量由信号量限制，超出的调用排队等待；遇到 429 时按照 Retry-After 或者
+    带随机抖动的指数退避等待后重试。其余属性（format、model_name 等）都转发给原始的模型包装器。
+    流式回复在调用返回后才开始读取，读取期间占用的连接由共享的HTTP连接池限制。
+    """
+
+    def __init__(self, model, max_concurrency=32, max_retries=5, backoff=1.0, max_backoff=30.0):
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __call__(self, *args, **kwargs):
+        name = self.model.config_name
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            with self._slots:
+                QUEUE_SECONDS.observe(time.perf_counter() - start, model=name)
+                try:
+                    return self.model(*args, **kwargs)
+                except Exception as e:
+                    delay = _rate_limit_delay(e)
+                    if delay is None or attempt == self.max_retries:
+                        raise
+            RATE_LIMITED.inc(model=name)
+            # 在退避时间的一半到全部之间随机等待，避免大量牌桌同时重试
+            backoff = min(self.max_backoff, self.backoff * 2 ** attempt)
+            time.sleep(max(delay, backoff * (0.5 + random.random() / 2)))
+
+
+class ModelClientPool:
+    """进程内共享的模型客户端池。
+
+    - `init_model` 可以重复调用，只在第一次调用时初始化 agentscope，之后只注册新的或者变化了的模型配置；
+    - 每个模型配置只创建一个模型包装器，OpenAI 兼容的客户端改为使用共享的 keep-alive 连接池，
+      连接数量有上限，连接用完时请求排队等待（最多 pool_timeout 秒），而不是为每个会话、每个智能体分别建立连接；
+    - 智能体按照 key 懒加载并在所有游戏之间复用，模型配置变化后重新创建。
+    """
+
+    def __init__(self, max_connections=32, max_retries=5, backoff=1.0, max_backoff=30.0, timeout=120.0,
+                 pool_timeout=60.0):
+        """
+        Args:
+            max_connections (int): 每个模型同时进行的请求数量以及HTTP连接数量上限
+            max_retries (int): 遇到 429 时的最大重试次数
+            backoff (float): 第一次重试前的等待时间（秒），之后每次加倍
+            max_backoff (float): 重试等待时间的上限（秒）
+            timeout (float): 单次HTTP请求的超时时间（秒），等待空闲连接的时间不计入
+            pool_timeout (float): 连接用完时等待空闲连接的最长时间（秒），超时抛出 httpx.PoolTimeout
+        """
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.pool_timeout = pool_timeout
+        self.initialized = False
+        self._configs = {}
+        self._models = {}
+        self._agents = {}
+        self._http_client = None
+        self._lock = threading.RLock()
+
+    def init_model(self, model_configs, **kwargs):
+        """注册模型配置，可以在每次点击"开始游戏"时调用
+
+        Args:
+            model_configs (List[dict]): agentscope 的模型配置列表
+            **kwargs: 第一次初始化时传给 `agentscope.init` 的其他参数
+        """
+        with self._lock:
+            if not self.initialized:
+                agentscope.init(model_configs=model_configs, **kwargs)
+                self.initialized = True
+                self._configs = {config["config_name"]: json.dumps(config, sort_keys=True)
+                                 for config in model_configs}
+                return
+            manager = ModelManager.get_instance()
+            for config in model_configs:
+                name = config["config_name"]
+                key = json.dumps(config, sort_keys=True)
+                if self._configs.get(name) == key:
+                    continue
+                # 配置变化（例如换了 API Key）时替换旧配置，并丢弃基于旧配置创建的模型和智能体
+                manager.model_configs.pop(name, None)
+                manager.load_model_configs([config])
+                self._configs[name] = key
+                self._models.pop(name, None)
+                for agent_key in [agent_key for agent_key in self._agents if agent_key[0] == name]:
+                    del self._agents[agent_key]
+
+    def _get_http_client(self):
+        if self._http_client is None:
+            import httpx
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                # 连接用完时排队等待空闲连接，但不会无限等待
+                timeout=httpx.Timeout(self.timeout, pool=self.pool_timeout),
+            )
+        return self._http_client
+
+    def get_model(self, config_name):
+        """返回模型配置对应的共享模型包装器，第一次使用时创建"""
+        with self._lock:
+            model = self._models.get(config_name)
+            if model is None:
+                wrapper = ModelManager.get_instance().get_model_by_config_name(config_name)
+                client = getattr(wrapper, "client", None)
+                if client is not None and hasattr(client, "copy"):
+                    # OpenAI 兼容的客户端：改用共享连接池，429 的重试由 PooledModel 负责
+                    wrapper.client = client.copy(http_client=self._get_http_client(), max_retries=0)
+                model = self._models[config_name] = PooledModel(wrapper, self.max_connections, self.max_retries,
+                                                                self.backoff, self.max_backoff)
+            return model
+
+    def get_agents(self, key, factory):
+        """返回 key 对应的智能体列表，第一次使用时调用 factory 创建。key 的第一项必须是模型配置名称，
+        智能体的模型替换为共享的模型包装器"""
+        with self._lock:
+            agents = self._agents.get(key)
+            if agents is None:
+                agents = factory()
+                for agent in agents:
+                    agent.model = self.get_model(key[0])
+                self._agents[key] = agents
+            return agents
+
+
+POOL = ModelClientPool(max_connections=int(os.environ.get("LIAR_BAR_MAX_CONNECTIONS", "32")))
+
+
+def init_model(model_configs, **kwargs):
+    """在进程内共享的客户端池中注册模型配置，参见 `ModelClientPool.init_model`"""
+    POOL.init_model(model_configs, **kwargs)
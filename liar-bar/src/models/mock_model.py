@@ -0,0 +1,144 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import json
+import random
+import re
+import time
+from typing import List, Optional, Sequence, Union
+
+from agentscope.message import Msg
+from agentscope.models import ModelResponse, ModelWrapperBase
+
+from models import client_pool
+
+TARGET_PATTERN = re.compile(r"这一轮的目标牌为: *(\S+)")
+CARDS_PATTERN = re.compile(r"我当前的手牌为: *(.*)")
+FIRST_PLAYER_HINT = "你是本轮第一位出牌的玩家"
+
+FAILURE_MODES = ("invalid_action", "invalid_cards", "malformed")
+
+
+class MockChatWrapper(ModelWrapperBase):
+    """本地模拟模型，不访问网络，按规则或脚本返回符合 MarkdownJsonDictParser 格式的回复，
+    支持模拟延迟和注入错误，用于离线压测游戏循环和 player_think 的重试逻辑。
+
+    模型配置示例:
+        {"model_type": "liar_bar_mock", "config_name": "mock", "latency": 0.05, "failure_rate": 0.1}
+    """
+
+    model_type: str = "liar_bar_mock"
+
+    def __init__(
+            self,
+            config_name: str,
+            model_name: str = "liar-bar-mock",
+            policy: str = "rule",
+            script: Optional[List[dict]] = None,
+            challenge_rate: float = 0.3,
+            latency: float = 0.0,
+            latency_jitter: float = 0.0,
+            failure_rate: float = 0.0,
+            failure_modes: Sequence[str] = FAILURE_MODES,
+            stream: bool = False,
+            seed: Optional[int] = None,
+            **kwargs,
+    ) -> None:
+        """
+        Args:
+            config_name (str): 模型配置名称
+            model_name (str): 模型名称
+            policy (str): 决策方式，"rule" 按规则决策，"script" 按顺序循环返回 script 中的回复
+            script (List[dict]): 脚本回复列表，每一项为包含 thought/action/cards 等字段的字典
+            challenge_rate (float): 规则决策时，有上家出牌的情况下选择质疑的概率
+            latency (float): 每次调用的固定延迟（秒）
+            latency_jitter (float): 在固定延迟上叠加的随机延迟上限（秒）
+            failure_rate (float): 返回错误回复的概率
+            failure_modes (Sequence[str]): 错误回复的类型，从 FAILURE_MODES 中选择
+            stream (bool): 是否以流式方式返回回复
+            seed (int): 随机种子
+        """
+        super().__init__(config_name=config_name, model_name=model_name)
+        if policy == "script" and not script:
+            raise ValueError("policy 'script' requires a non-empty script")
+        self.policy = policy
+        self.script = script or []
+        self.challenge_rate = challenge_rate
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.failure_modes = list(failure_modes)
+        self.stream = stream
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def format(self, *args: Union[Msg, Sequence[Msg]]) -> List[dict]:
+        messages = []
+        for arg in args:
+            if arg is None:
+                continue
+            for msg in arg if isinstance(arg, (list, tuple)) else [arg]:
+                messages.append({"role": msg.role, "name": msg.name, "content": msg.content})
+        return messages
+
+    def __call__(self, messages: List[dict], stream: Optional[bool] = None, **kwargs) -> ModelResponse:
+        self.calls += 1
+        if self.latency or self.latency_jitter:
+            time.sleep(self.latency + self.rng.uniform(0, self.latency_jitter))
+
+        prompt = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        if self.policy == "script":
+            content = dict(self.script[(self.calls - 1) % len(self.script)])
+        else:
+            content = self._rule_decision(str(prompt))
+
+        text = None
+        if self.failure_modes and self.rng.random() < self.failure_rate:
+            mode = self.rng.choice(self.failure_modes)
+            if mode == "invalid_action":
+                content["action"] = "fold"
+            elif mode == "invalid_cards":
+                content["cards"] = ["J"]
+            else:
+                text = "我还没想好……"
+        if text is None:
+            text = "```json\n" + json.dumps(content, ensure_ascii=False) + "\n```"
+
+        if self.stream if stream is None else stream:
+            return ModelResponse(stream=self._stream_text(text))
+        return ModelResponse(text=text)
+
+    @staticmethod
+    def _stream_text(text: str, chunk_size: int = 8):
+        for end in range(chunk_size, len(text) + chunk_size, chunk_size):
+            yield text[:end]
+
+    def _rule_decision(self, prompt: str) -> dict:
+        """按照简单规则决策：优先打出真牌，没有真牌时打一张假牌，有上家出牌时按概率质疑"""
+        target = TARGET_PATTERN.search(prompt)
+        target = target.group(1) if target else ""
+        cards = CARDS_PATTERN.search(prompt)
+        cards = [c.strip() for c in cards.group(1).split(",") if c.strip()] if cards else []
+        first = FIRST_PLAYER_HINT in prompt
+
+        if not first and (not cards or self.rng.random() < self.challenge_rate):
+            return {"thought": "上家很可能在撒谎", "action": "challenge", "cards": [],
+                    "misleading_statements": "我不信！"}
+        true_cards = [c for c in cards if c == target]
+        false_cards = [c for c in cards if c != target]
+        num = min(len(cards), self.rng.randint(1, 3))
+        played = (true_cards + false_cards)[:num]
+        return {"thought": f"打出{num}张牌", "action": "trust", "cards": played,
+                "misleading_statements": f"这{num}张都是{target}"}
+
+
+def init_mock_model(config_name: str = "mock", disable_saving: bool = False, **kwargs) -> dict:
+    """注册一个本地模拟模型配置，之后可以通过 model_config_name 使用
+
+    Args:
+        config_name (str): 模型配置名称，例如设置 `game.model_configuration_name = "mock"`
+        disable_saving (bool): 不在 ./runs 下保存日志和代码，测试和基准测试时使用；只在进程内第一次初始化时生效
+        **kwargs: 传给 MockChatWrapper 的参数，例如 latency、failure_rate
+    """
+    model_config = {"model_type": MockChatWrapper.model_type, "config_name": config_name, **kwargs}
+    client_pool.init_model([model_config], disable_saving=disable_saving)
+    return model_config
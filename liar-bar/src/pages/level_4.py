@@ -1,16 +1,21 @@
 # Copyright (c) 2024 King Jingxiang
 # See the LICENSE file for license rights and limitations (MIT).
+import contextlib
 import os
 import random
 import time
 
-import agentscope
 import streamlit as st
-from game.game import Game
+from game.game import Game, GameError
+from instrumentation import metrics
+from models import client_pool
+from policies.personas import BUILTIN_STYLES
+from server.streamlit_session import get_session_table, get_table_manager, watch_table
+from server.table_manager import TableError
 
 
-def display_player_status(player, game):
-    """显示指定玩家的状态信息"""
+def display_player_status(player, game, table):
+    """显示指定玩家的状态信息，轮到AI玩家时显示其流式输出，状态变化后自动刷新页面"""
     st.markdown(f"## {player}")
     if game.current_player == player:
         st.markdown('<h1 style="color:red;font-size:30px;">现在轮到你出牌！</h1>', unsafe_allow_html=True)
@@ -24,8 +29,9 @@ def display_player_status(player, game):
         else:
             st.write(f"你现在手里有 {len(game.player_cards[player])} 张牌")
             st.write(f"你现在的扮演的角色为: ？？？")
-            if game.current_player == player:
+            if game.current_player == player and table.status == "thinking":
                 st.markdown('<h3 style="color:blue;font-size:30px;">智能体思考中……</h3>', unsafe_allow_html=True)
+                watch_table(table.id, table.version, debug=False)
         # 显示最近一次出牌情况
         for play in reversed(game.current_round):
             if play["player"] == player:
@@ -52,17 +58,19 @@ def init_model(api_key):
             "stream": True,
         }
     ]
-    agentscope.init(model_configs=model_configs, logger_level="TRACE")
+    # 进程内只初始化一次，所有会话共享模型客户端和智能体
+    client_pool.init_model(model_configs, logger_level="TRACE")
 
 
 # 定义主函数
 def main():
-    # 初始化游戏
-    if "game" not in st.session_state:
-        st.session_state["game"] = Game()
-        st.session_state["game_started"] = False  # 标记游戏是否开始
-
-    game = st.session_state["game"]
+    render_start = time.perf_counter()
+    # 按环境变量开启指标导出
+    metrics.start_from_env()
+    # AI回合由进程内共享的牌桌管理器在后台推进，页面只负责渲染和提交用户行动
+    manager = get_table_manager()
+    table_id = get_session_table(manager)
+    table = manager.get_table(table_id) if table_id else None
 
     # Streamlit应用
     st.set_page_config(page_title="Card Game Interface", layout="wide")
@@ -78,75 +86,75 @@ def main():
     # 创建两列布局
     col1, col2 = st.columns([1, 2])  # 左窄右宽
 
-    # 左侧：出牌记录和角色对话
-    with col1:
-        st.subheader("📝 出牌记录和角色对话")
-        st.markdown("**出牌记录**")
-        st.markdown(game.get_game_logs(debug=False), unsafe_allow_html=True)
-        st.markdown("**质疑信息**")
-        st.markdown(game.get_challenge_info(), unsafe_allow_html=True)
+    # 渲染期间持有牌桌锁，后台的AI回合在渲染完成后才会出牌
+    with manager.view(table_id) if table else contextlib.nullcontext(Game()) as game:
+        # 左侧：出牌记录和角色对话
+        with col1:
+            st.subheader("📝 出牌记录和角色对话")
+            st.markdown("**出牌记录**")
+            st.markdown(game.get_game_logs(debug=False), unsafe_allow_html=True)
+            st.markdown("**质疑信息**")
+            st.markdown(game.get_challenge_info(), unsafe_allow_html=True)
+
+        # 右侧：每个角色的牌以2×2布局展示
+        with col2:
+            st.subheader("🎮 当前出牌情况")
+            start_button = st.button("开始游戏")
+            # 点击按钮会让页面重新运行，刷新牌桌状态
+            st.button("点我刷新")
+
+            grid_columns = st.columns(2)  # 分为两列
+            for i, player in enumerate(game.players):
+                with grid_columns[i % 2]:  # 在两列中交替显示
+                    if table:  # 游戏开始后显示信息
+                        display_player_status(player, game, table)
+
+            # 用户输入框（仅当当前玩家是用户时显示）
+            st.subheader("🚀 你的行动")
+            user_input = st.text_input("请输入您的出牌指令（例如：直接出牌: A K Q/提出质疑: challenge）",
+                                       key="user_action")
+            submit_button = st.button("提交")
 
-    # 右侧：每个角色的牌以2×2布局展示
     with col2:
-        st.subheader("🎮 当前出牌情况")
-        start_button = st.button("开始游戏")
-        refresh_button = st.button("点我刷新")
         if start_button:
             if not os.environ.get("AI_STUDIO_API_KEY", api_key):
                 st.error("请填写您的API Key")
                 return
             init_model(api_key)
-            game.initialize_agents()
+            if table_id:
+                manager.close_table(table_id)
+            # 点击开始按钮后，启动游戏
             random.seed(time.time())
-            game.initialize_players([random.choice(game.agents).name, "user",
-                                     random.choice(game.agents).name, random.choice(game.agents).name])
-            st.session_state["game_started"] = True
-            game.start_new_round()  # 点击开始按钮后，启动游戏
-
-        grid_columns = st.columns(2)  # 分为两列
-        for i, player in enumerate(game.players):
-            with grid_columns[i % 2]:  # 在两列中交替显示
-                if st.session_state["game_started"]:  # 游戏开始后显示信息
-                    display_player_status(player, game)
-
-        # 用户输入框（仅当当前玩家是用户时显示）
-        st.subheader("🚀 你的行动")
-        user_input = st.text_input("请输入您的出牌指令（例如：直接出牌: A K Q/提出质疑: challenge）", key="user_action")
-        if st.button("提交"):
-            if not game.current_player_is_user():
+            styles = [random.choice(BUILTIN_STYLES), "user", random.choice(BUILTIN_STYLES),
+                      random.choice(BUILTIN_STYLES)]
+            st.session_state["table_id"] = manager.create_table(styles, "aistudio")
+            st.rerun()
+        if submit_button:
+            if not table or table.status != "user_turn":
                 st.warning("现在还没轮到你出牌！")
+            elif user_input.strip():
+                try:
+                    if user_input.strip().startswith(game.action_space[1]):
+                        manager.submit_action(table_id, game.action_space[1])
+                    else:
+                        manager.submit_action(table_id, game.action_space[0], user_input.strip().split())
+                    st.rerun()
+                except (TableError, GameError):
+                    st.warning("出牌无效，请重新输入！")
             else:
-                if user_input.strip():
-                    try:
-                        if user_input.strip().startswith(game.action_space[1]):
-                            game.play(game.action_space[1], None)
-                        else:
-                            cards = user_input.strip().split()
-                            if game.check_played_cards(cards):
-                                game.play(game.action_space[0], cards)
-                            else:
-                                st.warning("出牌无效，请重新输入！")
-                            st.experimental_rerun()
-                    except Exception as e:
-                        st.error(f"输入无效：{e}")
-                else:
-                    st.warning("请先输入有效指令！")
-
-    # 游戏循环
-    while st.session_state["game_started"] and not game.is_over():
-        if game.current_player_is_user():
-            break  # 等待用户输入
-        else:
-            game.display_player_cards()
-            action, cards, thought, dialog = game.player_think()
-            if action == game.action_space[1]:
-                game.play(action, cards, thought, dialog)
-            else:
-                game.play(action, cards, thought, dialog)
-            st.experimental_rerun()
+                st.warning("请先输入有效指令！")
+
+    metrics.RENDER_SECONDS.observe(time.perf_counter() - render_start, page="level_4")
+
+    # AI回合因异常中断
+    if table and table.status == "error":
+        st.error(f"智能体出错：{table.error}")
+        if st.button("继续游戏"):
+            manager.resume(table_id)
+            st.rerun()
 
     # 游戏结束
-    if st.session_state["game_started"] and game.is_over():
+    if table and table.status == "over":
         winner = game.get_winner()
         st.success(f"🏆 游戏结束！{winner} 获胜！")
 
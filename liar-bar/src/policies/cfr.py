@@ -0,0 +1,358 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import argparse
+import os
+import random
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from game.compact_state import CHALLENGE, ENTRY_SIZE, MAX_ELIMINATION_FACTOR, NUM_TYPES, TRUST, CompactState
+from game.deck import HAND_SIZE
+from game.honesty_table import probability_from_state, probability_last_play_honest
+
+# 抽象行动：0为质疑，其余为出牌 (真牌数量, 假牌数量)，一次出1至3张
+PLAYS = [(true, num - true) for num in range(1, 4) for true in range(num, -1, -1)]
+NUM_ACTIONS = 1 + len(PLAYS)
+# 上家出牌全部为目标牌的概率分桶数量，0号桶表示本轮还没有人出牌
+HONESTY_BUCKETS = 5
+NUM_PLAYERS = 4
+# 信息集的各个维度：手里的真牌数、假牌数、概率分桶、自己和上家的剩余子弹数、存活人数、
+# 下家是否已经没有手牌（下家只能质疑）
+INFOSET_SHAPE = (HAND_SIZE + 1, HAND_SIZE + 1, HONESTY_BUCKETS + 1, MAX_ELIMINATION_FACTOR,
+                 MAX_ELIMINATION_FACTOR, NUM_PLAYERS - 1, 2)
+NUM_INFOSETS = int(np.prod(INFOSET_SHAPE))
+
+
+def infoset_index(true, false, probability, factor, previous_factor, alive, next_empty):
+    """把抽象后的信息集编码为整数下标，probability 为 None 表示本轮还没有人出牌"""
+    bucket = 0 if probability is None else 1 + min(HONESTY_BUCKETS - 1, int(probability * HONESTY_BUCKETS))
+    index = true
+    index = index * (HAND_SIZE + 1) + false
+    index = index * (HONESTY_BUCKETS + 1) + bucket
+    index = index * MAX_ELIMINATION_FACTOR + factor - 1
+    index = index * MAX_ELIMINATION_FACTOR + previous_factor - 1
+    index = index * (NUM_PLAYERS - 1) + alive - 2
+    return index * 2 + next_empty
+
+
+def _legal_actions(true, false, can_challenge):
+    actions = [0] if can_challenge else []
+    actions.extend(i + 1 for i, (t, f) in enumerate(PLAYS) if t <= true and f <= false)
+    return actions
+
+
+# 按 [能否质疑][真牌数][假牌数] 预先计算的合法行动
+_LEGAL_ACTIONS = [[[_legal_actions(true, false, can_challenge) for false in range(HAND_SIZE + 1)]
+                   for true in range(HAND_SIZE + 1)] for can_challenge in (False, True)]
+
+
+def legal_actions(true, false, can_challenge):
+    """当前手牌下合法的抽象行动"""
+    return _LEGAL_ACTIONS[can_challenge][true][false]
+
+
+def state_infoset(state):
+    """CompactState 当前玩家的信息集下标和合法行动"""
+    me = state.current
+    base = me * NUM_TYPES
+    hands = state.hands
+    true = hands[base + state.target]
+    false = hands[base] + hands[base + 1] + hands[base + 2] - true
+    if state.history_len:
+        previous = state.history[(state.history_len - 1) * ENTRY_SIZE]
+        probability, previous_factor = probability_from_state(state), state.factors[previous]
+    else:
+        probability, previous_factor = None, 1
+    next_empty = state.hand_size(state.next_player(me)) == 0
+    index = infoset_index(true, false, probability, state.factors[me], previous_factor, sum(state.alive), next_empty)
+    return index, legal_actions(true, false, state.history_len > 0)
+
+
+def game_infoset(game):
+    """Game 当前玩家的信息集下标和合法行动"""
+    cards = game.player_cards[game.current_player]
+    true = sum(1 for card in cards if card == game.target_card)
+    status = game.player_status
+    if game.current_round:
+        previous = game.current_round[-1]["player"]
+        probability, previous_factor = probability_last_play_honest(game), status[previous]["elimination_factor"]
+    else:
+        probability, previous_factor = None, 1
+    alive = sum(1 for player in game.players if status[player]["is_alive"])
+    next_empty = not game.player_cards[game._next_player(game.current_player)]
+    index = infoset_index(true, len(cards) - true, probability, status[game.current_player]["elimination_factor"],
+                          previous_factor, alive, next_empty)
+    return index, legal_actions(true, len(cards) - true, bool(game.current_round))
+
+
+def _regret_matching(regrets, offset, actions):
+    """根据累计遗憾值计算当前策略，正遗憾值之和为0时均匀随机"""
+    positive = [max(regrets[offset + action], 0.0) for action in actions]
+    total = sum(positive)
+    if total > 0:
+        return [value / total for value in positive]
+    return [1.0 / len(actions)] * len(actions)
+
+
+def _play_counts(state, action):
+    """把抽象的出牌行动还原为 A/K/Q 的数量，假牌优先从数量多的非目标牌中取"""
+    true, false = PLAYS[action - 1]
+    base = state.current * NUM_TYPES
+    target = state.target
+    counts = [0] * NUM_TYPES
+    counts[target] = true
+    first, second = (t for t in range(NUM_TYPES) if t != target)
+    if state.hands[base + second] > state.hands[base + first]:
+        first, second = second, first
+    counts[first] = min(false, state.hands[base + first])
+    counts[second] = false - counts[first]
+    return counts
+
+
+def _sample(rng, probabilities):
+    r = rng.random()
+    for i, probability in enumerate(probabilities):
+        r -= probability
+        if r < 0:
+            return i
+    return len(probabilities) - 1
+
+
+class CFRSolver:
+    """在抽象后的单轮游戏上运行结果采样的蒙特卡洛CFR（outcome-sampling MCCFR）。
+
+    每次迭代随机生成存活玩家和剩余子弹数，按照 CompactState 的规则发牌，轮流出牌直到有人质疑。
+    被惩罚的玩家收益为负的出局概率 -1/elimination_factor，其余存活玩家平分这部分收益，
+    因此是零和博弈。所有座位共用同一张信息集表，信息集只包含当前玩家能看到的抽象信息，
+    见 `INFOSET_SHAPE`。累计遗憾值和平均策略保存在稠密数组中，可以直接写入检查点。
+    """
+
+    def __init__(self, exploration=0.6):
+        """
+        Args:
+            exploration (float): 更新方采样时混入均匀随机策略的比例
+        """
+        self.exploration = exploration
+        self.regrets = np.zeros(NUM_INFOSETS * NUM_ACTIONS)
+        self.strategy_sum = np.zeros(NUM_INFOSETS * NUM_ACTIONS)
+        self.iterations = 0
+
+    def run(self, iterations, seed=None):
+        """在当前进程中运行 iterations 次迭代，返回本次迭代对遗憾值和平均策略的增量"""
+        regrets = array("d", self.regrets.tobytes())
+        strategy_sum = array("d", bytes(len(regrets) * regrets.itemsize))
+        rng = random.Random(seed)
+        for _ in range(iterations):
+            self._iteration(rng, regrets, strategy_sum)
+        regret_delta = np.frombuffer(regrets, dtype=np.float64) - self.regrets
+        strategy_delta = np.frombuffer(strategy_sum, dtype=np.float64)
+        self.regrets += regret_delta
+        self.strategy_sum += strategy_delta
+        self.iterations += iterations
+        return regret_delta, strategy_delta
+
+    def _iteration(self, rng, regrets, strategy_sum):
+        # 机会节点：存活玩家、剩余子弹数、发牌和第一个出牌的玩家按真实概率采样，在权重中相互抵消
+        state = CompactState(NUM_PLAYERS, rng=rng)
+        seats = rng.sample(range(NUM_PLAYERS), rng.randint(2, NUM_PLAYERS))
+        for player in range(NUM_PLAYERS):
+            state.alive[player] = int(player in seats)
+            state.factors[player] = rng.randint(1, MAX_ELIMINATION_FACTOR)
+        state.deal()
+        state.current = rng.choice(seats)
+        update_player = rng.choice(seats)
+        exploration = self.exploration
+
+        path = []
+        my_reach = opp_reach = sample_reach = 1.0
+        while True:
+            offset, actions = state_infoset(state)
+            offset *= NUM_ACTIONS
+            policy = _regret_matching(regrets, offset, actions)
+            is_update_player = state.current == update_player
+            if is_update_player:
+                uniform = exploration / len(actions)
+                sample_policy = [uniform + (1 - exploration) * p for p in policy]
+            else:
+                sample_policy = policy
+            i = _sample(rng, sample_policy)
+            if is_update_player:
+                path.append((offset, actions, policy, sample_policy[i], i, my_reach, opp_reach, sample_reach))
+                my_reach *= policy[i]
+            else:
+                opp_reach *= policy[i]
+            sample_reach *= sample_policy[i]
+            action = actions[i]
+            if action == 0:
+                break
+            a, k, q = _play_counts(state, action)
+            state.play(a, k, q)
+            base = state.current * NUM_TYPES
+            if state.hands[base] + state.hands[base + 1] + state.hands[base + 2] == 0:
+                # 手牌打完的玩家只能质疑，不是决策节点
+                break
+
+        # 终局收益：被惩罚的玩家失去出局概率，其余存活玩家平分
+        offset = (state.history_len - 1) * ENTRY_SIZE
+        history = state.history
+        honest = all(history[offset + 2 + t] == 0 for t in range(NUM_TYPES) if t != state.target)
+        punished = state.current if honest else history[offset]
+        loss = 1.0 / state.factors[punished]
+        value = -loss if punished == update_player else loss / (len(seats) - 1)
+
+        # 沿采样路径回溯，更新更新方每个信息集的遗憾值和平均策略
+        for offset, actions, policy, sampled, i, reach, opponents, sampled_reach in reversed(path):
+            child_value = value / sampled
+            value = policy[i] * child_value
+            weight = opponents / sampled_reach
+            for j, action in enumerate(actions):
+                regrets[offset + action] += weight * ((child_value if j == i else 0.0) - value)
+                strategy_sum[offset + action] += reach * policy[j] / sampled_reach
+
+    def average_policy(self):
+        """平均策略，形状为 (NUM_INFOSETS, NUM_ACTIONS)，没有访问过的信息集为全0"""
+        strategy = self.strategy_sum.reshape(NUM_INFOSETS, NUM_ACTIONS)
+        total = strategy.sum(axis=1, keepdims=True)
+        return np.divide(strategy, total, out=np.zeros_like(strategy), where=total > 0).astype(np.float32)
+
+    def save(self, path):
+        """把遗憾值和平均策略的累计值压缩保存为检查点"""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, regrets=self.regrets, strategy_sum=self.strategy_sum,
+                            iterations=np.array(self.iterations), infoset_shape=np.array(INFOSET_SHAPE))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """从检查点恢复，信息集的抽象方式变化后无法恢复"""
+        with np.load(path) as data:
+            if tuple(data["infoset_shape"]) != INFOSET_SHAPE:
+                raise ValueError(f"Checkpoint {path} was trained with a different infoset abstraction")
+            solver = cls(**kwargs)
+            solver.regrets = data["regrets"].astype(np.float64)
+            solver.strategy_sum = data["strategy_sum"].astype(np.float64)
+            solver.iterations = int(data["iterations"])
+        return solver
+
+
+def _run_batch(args):
+    regrets, iterations, exploration, seed = args
+    solver = CFRSolver(exploration)
+    solver.regrets = np.array(regrets)
+    return solver.run(iterations, seed)
+
+
+def train(iterations, solver=None, workers=None, batch_size=20000, seed=0, checkpoint=None):
+    """多进程训练：每批迭代开始时把当前遗憾值分发给各个进程，各进程独立迭代后返回增量并汇总，
+    每批结束后写入检查点
+
+    Args:
+        iterations (int): 迭代次数
+        solver (CFRSolver): 继续训练的求解器，默认新建
+        workers (int): 进程数量，默认为CPU核数，为1时在当前进程中训练
+        batch_size (int): 每个进程每批的迭代次数
+        seed (int): 随机种子，相同的种子、进程数量和批大小总能得到相同的结果
+        checkpoint (str): 检查点路径
+
+    Returns:
+        CFRSolver: 训练后的求解器
+    """
+    solver = solver or CFRSolver()
+    workers = workers or os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        done = 0
+        while done < iterations:
+            sizes = [min(batch_size, iterations - done - i * batch_size) for i in range(workers)]
+            sizes = [size for size in sizes if size > 0]
+            tasks = [(solver.regrets, size, solver.exploration, f"{seed}:{solver.iterations}:{i}")
+                     for i, size in enumerate(sizes)]
+            results = executor.map(_run_batch, tasks) if executor else map(_run_batch, tasks)
+            for regret_delta, strategy_delta in list(results):
+                solver.regrets += regret_delta
+                solver.strategy_sum += strategy_delta
+            solver.iterations += sum(sizes)
+            done += sum(sizes)
+            if checkpoint:
+                solver.save(checkpoint)
+    finally:
+        if executor:
+            executor.shutdown()
+    return solver
+
+
+class CFRPolicy:
+    """使用CFR平均策略的玩家，按照策略概率随机选择抽象行动，没有访问过的信息集均匀随机。
+    `__call__` 与规则策略签名相同，`act` 可以作为 run_compact_games 的策略。"""
+
+    def __init__(self, policy):
+        """
+        Args:
+            policy (np.ndarray): 形状为 (NUM_INFOSETS, NUM_ACTIONS) 的平均策略
+        """
+        self.policy = policy
+
+    @classmethod
+    def load(cls, path):
+        """从 `CFRSolver.save` 写入的检查点加载"""
+        return cls(CFRSolver.load(path).average_policy())
+
+    def probabilities(self, index, actions):
+        row = self.policy[index]
+        probabilities = [float(row[action]) for action in actions]
+        total = sum(probabilities)
+        if total > 0:
+            return [probability / total for probability in probabilities]
+        return [1.0 / len(actions)] * len(actions)
+
+    def act(self, state):
+        """在 CompactState 上选择行动，返回 (action, a, k, q)"""
+        index, actions = state_infoset(state)
+        action = actions[_sample(state.rng, self.probabilities(index, actions))]
+        if action == 0:
+            return CHALLENGE, 0, 0, 0
+        return (TRUST, *_play_counts(state, action))
+
+    def __call__(self, game):
+        """规则策略的签名：policy(game) -> (action, cards, thought, dialog)"""
+        index, actions = game_infoset(game)
+        probabilities = self.probabilities(index, actions)
+        action = actions[_sample(game.rng, probabilities)]
+        thought = f"CFR策略中该行动的概率为{probabilities[actions.index(action)]:.0%}"
+        if action == 0:
+            return game.action_space[1], None, thought, "我不信，亮牌吧！"
+        true, false = PLAYS[action - 1]
+        target = game.target_card
+        cards = game.player_cards[game.current_player]
+        played = [card for card in cards if card == target][:true] + [card for card in cards if card != target][:false]
+        return game.action_space[0], played, thought, f"{len(played)}张{target}。"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多进程训练骗子酒馆的MCCFR策略")
+    parser.add_argument("-n", "--iterations", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint", default="cfr_checkpoint.npz")
+    parser.add_argument("--resume", action="store_true", help="从检查点继续训练")
+    parser.add_argument("--evaluate", type=int, default=1000, help="训练后与随机策略对战的局数")
+    args = parser.parse_args()
+    solver = CFRSolver.load(args.checkpoint) if args.resume and os.path.exists(args.checkpoint) else None
+    start = time.perf_counter()
+    solver = train(args.iterations, solver, args.workers, args.batch_size, args.seed, args.checkpoint)
+    elapsed = time.perf_counter() - start
+    print(f"iterations: {solver.iterations}, elapsed: {elapsed:.2f}s, iterations/sec: {args.iterations / elapsed:.0f}")
+    if args.evaluate:
+        from game.simulation import random_compact_policy, run_compact_games
+
+        cfr = CFRPolicy(solver.average_policy())
+
+        def seat0_cfr(state):
+            return cfr.act(state) if state.current == 0 else random_compact_policy(state)
+
+        stats = run_compact_games(args.evaluate, ["cfr", "random1", "random2", "random3"], seat0_cfr, seed=args.seed)
+        print(f"cfr win rate against random policies: {stats.win_rates()['cfr']:.3f}")
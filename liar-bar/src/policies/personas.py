@@ -0,0 +1,115 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import tools.tool as tools
+from game.honesty_table import probability_last_play_honest
+
+
+def _split_hand(game):
+    """把当前玩家的手牌分为目标牌和非目标牌"""
+    target = game.target_card
+    cards = game.player_cards[game.current_player]
+    true_cards = [card for card in cards if card == target]
+    false_cards = [card for card in cards if card != target]
+    return true_cards, false_cards
+
+
+def _play(game, cards, thought, dialog):
+    return game.action_space[0], cards, thought, dialog
+
+
+def _challenge(game, thought, dialog):
+    return game.action_space[1], None, thought, dialog
+
+
+def _mix(true_cards, false_cards, num, prefer_true=True):
+    """凑出 num 张牌，优先使用目标牌（或者优先使用非目标牌）"""
+    first, second = (true_cards, false_cards) if prefer_true else (false_cards, true_cards)
+    cards = first[:num]
+    return cards + second[:num - len(cards)]
+
+
+def honest_probability(game):
+    """上家最后一次出牌全部是目标牌的概率，来自 `game.honesty_table` 的精确概率表，没有上家出牌时返回1"""
+    probability = probability_last_play_honest(game)
+    return 1.0 if probability is None else probability
+
+
+def coward_policy(game):
+    """胆小鬼：每次只出一张牌，优先出目标牌；没有目标牌时一半概率质疑上家，否则出一张假牌蒙混过关"""
+    true_cards, false_cards = _split_hand(game)
+    if true_cards:
+        return _play(game, true_cards[:1], "我手里还有目标牌，稳妥起见只出一张真牌", f"这是一张{game.target_card}")
+    if game.current_round and (not false_cards or game.rng.random() < 0.5):
+        return _challenge(game, "我没有目标牌了，上家也可能在撒谎，质疑他", "我觉得你在撒谎……")
+    return _play(game, false_cards[:1], "我没有目标牌，先出一张假牌，等下一轮再质疑", f"这是一张{game.target_card}")
+
+
+def augur_policy(game):
+    """占卜师：完全按照占卜结果出牌或质疑，本轮第一个出牌时只能出牌"""
+    true_cards, false_cards = _split_hand(game)
+    play, is_true_card, num = tools.divine(game.player_cards[game.current_player], game.target_card, game.rng)
+    if not play and game.current_round:
+        return _challenge(game, "占卜结果指示我质疑上家", "命运告诉我，你在撒谎！")
+    if not play:
+        # 第一个出牌时无法质疑，出一张牌
+        is_true_card, num = bool(true_cards), 1
+    cards = _mix(true_cards, false_cards, num, prefer_true=is_true_card)
+    return _play(game, cards, f"占卜结果指示我出{num}张{'真' if is_true_card else '假'}牌",
+                 f"命运让我打出{num}张{game.target_card}")
+
+
+def bold_gambler_policy(game):
+    """大胆赌徒：上家可疑时即使自己目标牌不多也果断质疑；出牌时一次出2至3张，目标牌不够就用假牌充数"""
+    true_cards, false_cards = _split_hand(game)
+    cards = true_cards + false_cards
+    if game.current_round and (not cards or honest_probability(game) < 0.5 or game.rng.random() < 0.3):
+        return _challenge(game, "上家很可能在撒谎，赌一把", "我赌你在撒谎，亮牌吧！")
+    num = min(len(cards), game.rng.randint(2, 3))
+    played = _mix(true_cards, false_cards, num)
+    return _play(game, played, f"一次打出{num}张牌，加快节奏", f"{num}张{game.target_card}，不信就来质疑我！")
+
+
+def cool_analyzer_policy(game):
+    """冷静分析者：计算上家诚实的概率，较低时质疑；否则优先出真牌，
+    目标牌多时出2至3张加快进程，否则出1张保持低调"""
+    true_cards, false_cards = _split_hand(game)
+    probability = honest_probability(game)
+    if game.current_round and (not (true_cards or false_cards) or probability < 0.35
+                               or (not true_cards and probability < 0.5)):
+        return _challenge(game, f"上家出的全是目标牌的概率只有{probability:.0%}，质疑成功的可能性较大",
+                          "从概率上看，你的出牌站不住脚。")
+    if true_cards:
+        num = min(len(true_cards), 3) if len(true_cards) >= 2 else 1
+        return _play(game, true_cards[:num], f"上家诚实的概率为{probability:.0%}，用{num}张真牌出牌风险较小",
+                     f"{num}张{game.target_card}。")
+    return _play(game, false_cards[:1], "没有目标牌，只出一张假牌观察局势", f"一张{game.target_card}。")
+
+
+def cunning_liar_policy(game):
+    """狡黠骗子：优先用非目标牌冒充目标牌，偶尔打出一张真牌混淆视听，只在上家非常可疑时质疑"""
+    true_cards, false_cards = _split_hand(game)
+    if game.current_round and (not (true_cards or false_cards) or honest_probability(game) < 0.25):
+        return _challenge(game, "上家的牌几乎不可能是真的", "别装了，你的牌有问题！")
+    if not false_cards or (true_cards and game.rng.random() < 0.25):
+        return _play(game, true_cards[:1], "偶尔出一张真牌，让别人以为我一直在说实话",
+                     f"我这张可能是假的哦，{game.target_card}？你猜。")
+    num = min(len(false_cards), game.rng.randint(1, 2))
+    return _play(game, false_cards[:num], f"用{num}张非目标牌冒充目标牌",
+                 f"{num}张{game.target_card}，谁敢质疑我？")
+
+
+PERSONA_POLICIES = {
+    "augur": augur_policy,
+    "coward": coward_policy,
+    "bold_gambler": bold_gambler_policy,
+    "cool_analyzer": cool_analyzer_policy,
+    "cunning_liar": cunning_liar_policy,
+}
+
+# Game.initialize_agents 中内置的五种角色
+BUILTIN_STYLES = list(PERSONA_POLICIES)
+
+
+def get_policy(style):
+    """角色对应的规则策略，未知的角色返回None"""
+    return PERSONA_POLICIES.get(style)
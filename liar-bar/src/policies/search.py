@@ -0,0 +1,243 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import random
+import time
+from array import array
+
+from game.compact_state import (CARD_CODES, CHALLENGE, ENTRY_SIZE, NUM_TYPES, TRUST, CompactState, decode_counts,
+                                encode_cards)
+from game.deck import CARDS_PER_TYPE, HAND_SIZE, WILDCARDS
+
+
+def _draw(counts, num, random):
+    """从 A/K/Q 数量为 counts 的牌中不放回地随机抽出 num 张，返回抽到的数量"""
+    a, k, q = counts
+    size = a + k + q
+    drawn = [0, 0, 0]
+    for _ in range(num):
+        index = int(random() * size)
+        if index < a:
+            a -= 1
+            drawn[0] += 1
+        elif index < a + k:
+            k -= 1
+            drawn[1] += 1
+        else:
+            q -= 1
+            drawn[2] += 1
+        size -= 1
+    return drawn
+
+
+def fast_rollout_policy(state, challenge_rate=0.3):
+    """与 random_compact_policy 分布相同的随机策略，只调用 rng.random()，用于推演"""
+    random = state.rng.random
+    base = state.current * NUM_TYPES
+    hands = state.hands
+    counts = (hands[base], hands[base + 1], hands[base + 2])
+    size = counts[0] + counts[1] + counts[2]
+    if state.history_len and (not size or random() < challenge_rate):
+        return CHALLENGE, 0, 0, 0
+    drawn = _draw(counts, 1 + int(random() * min(3, size)), random)
+    return TRUST, drawn[0], drawn[1], drawn[2]
+
+
+def _candidate_actions(hand, target, can_challenge):
+    """当前玩家所有不同的行动：质疑，以及出1至3张牌时真牌数量的每种可能。
+    假牌先从数量多的非目标牌中取，牌型不同但真假数量相同的出法对结果没有影响"""
+    actions = [(CHALLENGE, 0, 0, 0)] if can_challenge else []
+    others = sorted((t for t in range(NUM_TYPES) if t != target), key=lambda t: -hand[t])
+    num_false = hand[others[0]] + hand[others[1]]
+    for num in range(1, min(3, hand[target] + num_false) + 1):
+        for true in range(max(0, num - num_false), min(num, hand[target]) + 1):
+            counts = [0] * NUM_TYPES
+            counts[target] = true
+            false = num - true
+            counts[others[0]] = min(false, hand[others[0]])
+            counts[others[1]] = false - counts[others[0]]
+            actions.append((TRUST, counts[0], counts[1], counts[2]))
+    return actions
+
+
+class Observation:
+    """当前玩家能看到的信息：目标牌、自己的手牌和本轮自己打出的牌、其他玩家每次出牌的数量、
+    存活状态和剩余子弹数。其他玩家手牌和出牌的具体内容都是未知的。"""
+
+    __slots__ = ("me", "num_players", "target", "hand", "history", "alive", "factors", "round")
+
+    def __init__(self, me, num_players, target, hand, history, alive, factors, round=1):
+        self.me = me
+        self.num_players = num_players
+        self.target = target
+        # 自己当前手牌 A/K/Q 的数量
+        self.hand = list(hand)
+        # 本轮出牌记录 [(玩家, A/K/Q 数量或者 None, 数量)]，其他玩家的出牌内容为 None
+        self.history = history
+        self.alive = list(alive)
+        self.factors = list(factors)
+        self.round = round
+
+    @classmethod
+    def from_game(cls, game):
+        """从 Game（或 CompactGame）中提取当前玩家的观察"""
+        players = game.players
+        me = players.index(game.current_player)
+        history = []
+        for entry in game.current_round:
+            if entry["action"] != game.action_space[0]:
+                continue
+            player = players.index(entry["player"])
+            counts = encode_cards(entry["cards"]) if player == me else None
+            history.append((player, counts, len(entry["cards"])))
+        return cls(me, len(players), CARD_CODES[game.target_card],
+                   encode_cards(game.player_cards[game.current_player]), history,
+                   [game.player_status[player]["is_alive"] for player in players],
+                   [game.player_status[player]["elimination_factor"] for player in players], game.round)
+
+    @classmethod
+    def from_state(cls, state):
+        """从 CompactState 中提取当前玩家的观察，丢弃其他玩家的隐藏信息"""
+        me = state.current
+        history = []
+        for i in range(state.history_len):
+            offset = i * ENTRY_SIZE
+            if state.history[offset + 1] != TRUST:
+                continue
+            player = state.history[offset]
+            counts = list(state.history[offset + 2:offset + 2 + NUM_TYPES])
+            history.append((player, counts if player == me else None, sum(counts)))
+        return cls(me, state.num_players, state.target, state.hand(me), history, state.alive, state.factors,
+                   state.round)
+
+    def unseen(self):
+        """本轮发给其他玩家的牌：整副牌减去自己发到的牌"""
+        counts = [CARDS_PER_TYPE] * NUM_TYPES
+        counts[self.target] += WILDCARDS
+        for t in range(NUM_TYPES):
+            counts[t] -= self.hand[t]
+        for player, played, _ in self.history:
+            if player == self.me:
+                for t in range(NUM_TYPES):
+                    counts[t] -= played[t]
+        return bytes(t for t in range(NUM_TYPES) for _ in range(counts[t]))
+
+
+class SearchAgent:
+    """基于采样的搜索智能体（确定化蒙特卡洛）。
+
+    每次采样都从与公开信息一致的隐藏手牌中随机抽取一种（其他玩家的初始手牌以及本轮每次出牌的内容），
+    在复制出的 CompactState 上对每个候选行动做一次推演，直到本轮有人质疑为止，
+    按照自己是否受罚以及受罚后的存活概率计分。所有候选行动共用同一次采样，减少比较时的方差。
+    在时间预算内尽可能多地采样，既可以作为对手（`__call__` 与规则策略签名相同），
+    也可以作为顾问（`advise` 返回每个行动的评估结果）。
+    """
+
+    def __init__(self, time_budget=0.05, max_samples=None, rollout_policy=None, seed=None):
+        """
+        Args:
+            time_budget (float): 每次决策的时间预算（秒），None 表示只受最大采样次数限制
+            max_samples (int): 最大采样次数，None 表示只受时间预算限制
+            rollout_policy (Callable): 推演时其他玩家的策略 policy(state) -> (action, a, k, q)，
+                默认使用 `fast_rollout_policy`
+            seed (int): 随机种子
+        """
+        if time_budget is None and max_samples is None:
+            raise ValueError("time_budget and max_samples cannot both be None")
+        self.time_budget = time_budget
+        self.max_samples = max_samples
+        self.rollout_policy = rollout_policy or fast_rollout_policy
+        self.rng = random.Random(seed)
+        self.samples = 0
+        self.rollouts = 0
+
+    def determinize(self, observation):
+        """采样一个与观察一致的完整状态，当前玩家为观察者"""
+        rng = self.rng
+        me = observation.me
+        num_players = observation.num_players
+        state = CompactState(num_players, rng=rng)
+        state.target = observation.target
+        state.current = me
+        state.round = observation.round
+        state.alive = array("b", observation.alive)
+        state.factors = array("b", observation.factors)
+        pool = bytearray(observation.unseen())
+        rng.shuffle(pool)
+        hands = state.hands
+        others = [player for player in range(num_players) if player != me]
+        for i, player in enumerate(others):
+            for card in pool[i * HAND_SIZE:(i + 1) * HAND_SIZE]:
+                hands[player * NUM_TYPES + card] += 1
+        for t in range(NUM_TYPES):
+            hands[me * NUM_TYPES + t] = observation.hand[t]
+        for player, played, num in observation.history:
+            if played is None:
+                # 从该玩家剩余的手牌中随机抽出 num 张作为这次出牌的内容
+                base = player * NUM_TYPES
+                played = _draw(hands[base:base + NUM_TYPES], num, rng.random)
+                for t in range(NUM_TYPES):
+                    hands[base + t] -= played[t]
+            state._record(player, TRUST, played[0], played[1], played[2])
+        return state
+
+    def _rollout(self, state, me, action):
+        """执行当前玩家的行动并推演到本轮结束，返回自己的得分：
+        没有受罚为1，受罚时为受罚后的存活概率 1 - 1/elimination_factor"""
+        policy = self.rollout_policy
+        hands = state.hands
+        while True:
+            if action[0] == CHALLENGE:
+                offset = state.last_play()
+                history = state.history
+                target = state.target
+                honest = all(history[offset + 2 + t] == 0 for t in range(NUM_TYPES) if t != target)
+                punished = state.current if honest else history[offset]
+                if punished != me:
+                    return 1.0
+                return 1.0 - 1.0 / state.factors[me]
+            state.play(action[1], action[2], action[3])
+            base = state.current * NUM_TYPES
+            if hands[base] + hands[base + 1] + hands[base + 2] == 0:
+                # 手牌打完的玩家只能质疑
+                action = (CHALLENGE, 0, 0, 0)
+            else:
+                action = policy(state)
+
+    def evaluate(self, observation):
+        """在时间预算内采样，返回 [(行动, 平均得分, 采样次数)]，按得分从高到低排序"""
+        hand = observation.hand
+        actions = _candidate_actions(hand, observation.target, bool(observation.history))
+        totals = [0.0] * len(actions)
+        samples = 0
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        while (self.max_samples is None or samples < self.max_samples) and (
+                samples == 0 or deadline is None or time.perf_counter() < deadline):
+            state = self.determinize(observation)
+            for i, action in enumerate(actions):
+                totals[i] += self._rollout(state.clone(), observation.me, action)
+            samples += 1
+        self.samples += samples
+        self.rollouts += samples * len(actions)
+        results = [(action, total / samples, samples) for action, total in zip(actions, totals)]
+        results.sort(key=lambda result: -result[1])
+        return results
+
+    def search(self, state):
+        """在 CompactState 上为当前玩家选择行动，返回 (action, a, k, q)，可以作为 run_compact_games 的策略"""
+        return self.evaluate(Observation.from_state(state))[0][0]
+
+    def advise(self, game):
+        """为 Game 的当前玩家评估所有行动，返回 [{"action", "cards", "value", "samples"}]，按得分从高到低排序"""
+        results = self.evaluate(Observation.from_game(game))
+        return [{"action": game.action_space[action[0]], "cards": decode_counts(action[1:]) or None,
+                 "value": value, "samples": samples} for action, value, samples in results]
+
+    def __call__(self, game):
+        """规则策略的签名：policy(game) -> (action, cards, thought, dialog)"""
+        advice = self.advise(game)
+        best = advice[0]
+        thought = f"采样{best['samples']}次，" + "，".join(
+            f"{item['action']} {''.join(item['cards'] or [])} 期望得分{item['value']:.2f}" for item in advice[:3])
+        if best["action"] == game.action_space[1]:
+            return best["action"], None, thought, "我不信，亮牌吧！"
+        return best["action"], best["cards"], thought, f"{len(best['cards'])}张{game.target_card}。"
@@ -41,6 +41,18 @@ rule = """请你扮演一个游戏角色来完成游戏！
 - 请记住，每局总共20张牌，其中最多有8张目标牌，玩家打出的目标牌有可能是假的，如果觉得玩家打出的牌可能是冒充的牌，请勇敢质疑
 """
 
+# 精简版规则，保留完整规则中影响决策的全部信息，用于减少每次调用的输入token
+compact_rule = """请你扮演一个游戏角色来完成游戏！
+### 游戏规则
+- 牌组共20张：A、K、Q各6张，另有2张万能牌在发牌时替换为本轮目标牌，因此每轮最多8张目标牌，玩家手里只会有['A', 'K', 'Q']三种牌。
+- 每轮随机确定一种牌作为目标牌，每位玩家发5张牌，按座位顺序（顺时针）依次行动。
+- 出牌：背面朝上打出1至3张牌并声明都是目标牌，可以用任意牌冒充目标牌，不可以跳过。
+- 轮到你时，可以相信(trust)上家并继续出牌，也可以质疑(challenge)上家并查看他打出的牌；本轮第一位出牌的玩家只能出牌。
+- 质疑后撒谎的一方受罚：上家打出的牌中有非目标牌则上家受罚，否则质疑者受罚。受罚玩家有一定概率出局，每受罚一次出局概率都会增加，之后开始新的一轮。
+- 出局的玩家不再参与游戏，只剩一名玩家时该玩家获胜。
+- 你的目标是存活到最后：可以推测并勇敢质疑别人，也可以真假掺杂地出牌。
+"""
+
 coward_role = """**角色设定：**
 - 请扮演一位非常谨慎且不喜欢冒险的角色。你的目标是在保持诚实的同时，尽量避免不必要的风险。
 - 在每一轮中，优先考虑将手中的真实牌打出，以减少被质疑的风险。
@@ -89,6 +101,14 @@ current_player_prompt = """
 {round_info}
 """
 
+honesty_hint_prompt = """
+根据牌组组成精确计算：如果上家优先打出真牌，他这次出的{num}张牌全部是{target_card}的概率为{probability:.0%}。
+"""
+
+routed_move_prompt = """
+这一回合我已经决定：{move}。回复中的 action 和 cards 按照这个决定填写，重点是想一句迷惑其他玩家的话。
+"""
+
 first_player_prompt = """
 我是{player}玩家! 你是本轮第一位出牌的玩家！
 现在轮到我出牌了！
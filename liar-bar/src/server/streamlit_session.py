@@ -0,0 +1,65 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import os
+
+import streamlit as st
+from game.decision_router import DecisionRouter
+from server.table_manager import TableError, TableManager
+
+# AI回合进行中页面检查状态变化的间隔（秒）
+POLL_INTERVAL = 0.5
+
+# st.fragment 从 1.37 开始提供，之前的版本为 st.experimental_fragment
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+
+@st.cache_resource
+def get_table_manager():
+    """进程内共享的牌桌管理器，所有页面和会话共用同一个事件循环和模型调用线程池，
+    会话结束后不再访问的牌桌一小时后自动关闭。只能出牌、手牌打完等简单的局面由决策路由在本地决定行动，
+    其中 LIAR_BAR_ROUTED_DIALOG_RATE（默认0.25）比例的发言仍然由模型生成，其余使用角色策略的发言；
+    设置 LIAR_BAR_DECISION_ROUTER=0 可以让每次决策都完全由模型完成"""
+    router = None
+    if os.environ.get("LIAR_BAR_DECISION_ROUTER", "1") != "0":
+        router = DecisionRouter(route_first_play=True,
+                                dialog_rate=float(os.environ.get("LIAR_BAR_ROUTED_DIALOG_RATE", "0.25")))
+    return TableManager(max_concurrency=int(os.environ.get("LIAR_BAR_MAX_CONCURRENCY", "32")),
+                        idle_timeout=3600, decision_router=router)
+
+
+def get_session_table(manager):
+    """当前会话的牌桌ID，牌桌已经被关闭时返回None"""
+    table_id = st.session_state.get("table_id")
+    if table_id is not None and table_id not in manager.tables:
+        table_id = st.session_state["table_id"] = None
+    return table_id
+
+
+def format_thinking(parser, debug=True):
+    """把智能体流式输出的内容转换为 markdown，debug 为 False 时不显示思考过程和具体出牌"""
+    fields = parser.fields
+    lines = []
+    if debug and fields.get("thought"):
+        lines.append(f"思考: {fields['thought']}")
+    if parser.is_complete("action"):
+        lines.append(f"行动: {fields['action']}")
+    if fields.get("cards"):
+        cards = fields["cards"]
+        lines.append(f"出牌: {cards}" if debug else f"出牌: {len(cards)}张")
+    if fields.get("misleading_statements"):
+        lines.append(f"发言: {fields['misleading_statements']}")
+    return "\n\n".join(lines)
+
+
+@fragment(run_every=POLL_INTERVAL)
+def watch_table(table_id, version, debug=True):
+    """AI玩家思考时定期运行：只刷新流式输出，牌桌状态变化后才重新运行整个页面"""
+    try:
+        table = get_table_manager().get_table(table_id)
+    except TableError:
+        st.rerun()
+    if table.version != version:
+        st.rerun()
+    stream = table.stream
+    if stream is not None:
+        st.markdown(format_thinking(stream, debug))
@@ -0,0 +1,396 @@
+# Copyright (c) 2024 King Jingxiang
+# See the LICENSE file for license rights and limitations (MIT).
+import asyncio
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from game.game import Game, GameError
+from instrumentation import metrics
+
+TABLE_TURNS = metrics.REGISTRY.counter("liar_bar_table_turns", "AI turns played by the table manager", ("action",))
+TABLE_ERRORS = metrics.REGISTRY.counter("liar_bar_table_errors", "AI turns aborted by an unexpected error")
+
+
+class TableError(Exception):
+    """牌桌不存在或者操作不合法"""
+
+
+class Table:
+    """一张牌桌：游戏本身、状态版本号、当前AI玩家的流式输出以及推进AI回合的任务。
+    游戏状态只在持有 lock 时修改，版本号每次出牌后加一，等待方据此判断状态是否变化。"""
+
+    def __init__(self, table_id, game, challenge_pause=0.0):
+        self.id = table_id
+        self.game = game
+        self.challenge_pause = challenge_pause
+        self.version = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        # 当前AI玩家最新的流式解析结果，出牌后清空
+        self.stream = None
+        self.task = None
+        self.error = None
+        self.last_active = time.monotonic()
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return "error"
+        if not self.game.player_cards:
+            return "waiting"
+        if self.game.is_over():
+            return "over"
+        if self.game.current_player_is_user():
+            return "user_turn"
+        return "thinking"
+
+    def _bump(self):
+        """在持有 lock 时调用：版本号加一并唤醒等待方"""
+        self.version += 1
+        self.stream = None
+        self.changed.notify_all()
+
+
+class TableManager:
+    """在一个进程中托管大量牌桌。
+
+    所有牌桌的AI回合都调度在同一个后台线程的 asyncio 事件循环上，模型调用通过共享的线程池执行，
+    并由共享的信号量限制同时进行的调用数量，因此可承载的牌桌数量取决于模型的吞吐量，
+    而不是 Streamlit 的脚本线程。页面只需要在用户行动时调用 `submit_action`，
+    并通过 `snapshot`/`view` 读取状态、`wait_for_change` 等待状态变化。
+
+    Example:
+        manager = TableManager(max_concurrency=64)
+        table_id = manager.create_table(["coward", "user", "augur", "bold_gambler"], "aistudio")
+        version = manager.wait_for_change(table_id, 0, timeout=30)
+        manager.submit_action(table_id, "trust", ["Q"])
+    """
+
+    def __init__(self, max_concurrency=32, timeout=60.0, max_retry=3, challenge_pause=0.0, idle_timeout=None,
+                 decision_router=None):
+        """
+        Args:
+            max_concurrency (int): 同时进行的模型调用数量上限，同时也是执行模型调用的线程数
+            timeout (float): 每次模型调用的超时时间（秒）
+            max_retry (int): 每次决策的最大重试次数
+            challenge_pause (float): 质疑后暂停的时间（秒），让页面有时间展示质疑结果
+            idle_timeout (float): 牌桌超过该时间（秒）没有被访问则自动关闭，None 表示不自动关闭
+            decision_router (DecisionRouter): 所有牌桌共享的决策路由，None 表示AI玩家的每次决策都调用模型
+        """
+        self.timeout = timeout
+        self.max_retry = max_retry
+        self.challenge_pause = challenge_pause
+        self.idle_timeout = idle_timeout
+        self.decision_router = decision_router
+        self.tables = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="table-model")
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._thread = threading.Thread(target=self._run_loop, name="table-manager", daemon=True)
+        self._thread.start()
+        if idle_timeout:
+            self.loop.call_soon_threadsafe(lambda: self.loop.create_task(self._sweep_idle()))
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def create_table(self, styles, model_config_name="aistudio", seed=None, compact_rules=False, cache=None,
+                     context_policy=None, challenge_pause=None, probability_hint=False):
+        """创建一张牌桌并立即开始游戏，轮到AI玩家时会自动在后台推进
+
+        Args:
+            styles (List[str]): 每个座位的角色，"user" 表示由页面操作的玩家
+            model_config_name (str): agentscope 中已经初始化的模型配置名称
+            seed (int): 随机种子
+            compact_rules (bool): 使用精简版规则
+            cache (ResponseCache): 可选的模型回复缓存
+            context_policy (RoundContextPolicy): 提示词上下文策略
+            challenge_pause (float): 本桌质疑后暂停的时间（秒），默认使用管理器的设置
+            probability_hint (bool): 在提示词中给出上家出牌全部为目标牌的精确概率
+
+        Returns:
+            str: 牌桌ID
+        """
+        game = Game(seed, verbose=False, context_policy=context_policy, probability_hint=probability_hint,
+                    decision_router=self.decision_router)
+        game.model_configuration_name = model_config_name
+        game.initialize_agents(cache, compact_rules)
+        game.initialize_players(styles)
+        game.start_new_round()
+        return self.add_table(game, challenge_pause)
+
+    def add_table(self, game, challenge_pause=None):
+        """托管一局已经初始化好的游戏"""
+        table_id = str(next(self._ids))
+        table = Table(table_id, game, self.challenge_pause if challenge_pause is None else challenge_pause)
+        with self._lock:
+            self.tables[table_id] = table
+        self._schedule(table)
+        return table_id
+
+    def get_table(self, table_id):
+        table = self.tables.get(table_id)
+        if table is None:
+            raise TableError(f"Table {table_id} not found")
+        table.last_active = time.monotonic()
+        return table
+
+    def close_table(self, table_id):
+        """关闭牌桌，正在进行的AI回合会被取消"""
+        with self._lock:
+            table = self.tables.pop(table_id, None)
+        if table is not None and table.task is not None:
+            self.loop.call_soon_threadsafe(table.task.cancel)
+
+    def submit_action(self, table_id, action, cards=None, thought=None, dialog=None):
+        """提交用户玩家的行动，之后的AI回合在后台自动推进
+
+        Returns:
+            int: 行动后的版本号
+        """
+        table = self.get_table(table_id)
+        game = table.game
+        with table.lock:
+            if table.status != "user_turn":
+                raise TableError("Not the user's turn")
+            if action == game.action_space[1]:
+                if not game.current_round:
+                    raise TableError("Nothing to challenge")
+                cards = None
+            elif action != game.action_space[0] or not cards or not game.check_played_cards(cards):
+                raise TableError(f"Invalid play: {action} {cards}")
+            try:
+                with metrics.timer(metrics.PLAY_SECONDS, action=action):
+                    game.play(action, cards, thought, dialog)
+            except GameError as e:
+                # 出牌在修改状态之前校验，失败时游戏状态不变
+                raise TableError(f"Invalid play: {action} {cards}") from e
+            table._bump()
+            version = table.version
+        self._schedule(table)
+        return version
+
+    def resume(self, table_id):
+        """AI回合因异常中断后重新开始推进"""
+        table = self.get_table(table_id)
+        with table.lock:
+            table.error = None
+            table._bump()
+        self._schedule(table)
+
+    @contextmanager
+    def view(self, table_id):
+        """在持有牌桌锁的情况下直接读取游戏对象，用于同进程的页面渲染；期间AI回合在线程池中等待出牌，
+        不会阻塞事件循环和其他牌桌，但仍应尽快退出"""
+        table = self.get_table(table_id)
+        with table.lock:
+            yield table.game
+
+    def snapshot(self, table_id, debug=False):
+        """牌桌状态的可序列化快照，debug 为 False 时不包含AI玩家的手牌和思考过程"""
+        table = self.get_table(table_id)
+        game = table.game
+        with table.lock:
+            players = {}
+            for player in game.players:
+                status = game.player_status[player]
+                cards = game.player_cards.get(player, [])
+                show = debug or status["style"] == "user"
+                players[player] = {
+                    "style": status["style"],
+                    "is_alive": status["is_alive"],
+                    "elimination_factor": status["elimination_factor"],
+                    "num_cards": len(cards),
+                    "cards": list(cards) if show else None,
+                }
+            stream = table.stream
+            thinking = None
+            if stream is not None:
+                # fields 由执行模型调用的线程写入，先复制再遍历
+                thinking = {key: value for key, value in stream.fields.copy().items() if debug or key != "thought"}
+                if not debug:
+                    thinking.pop("cards", None)
+            over = game.is_over()
+            return {
+                "table_id": table.id,
+                "version": table.version,
+                "status": table.status,
+                "error": table.error,
+                "round": game.round,
+                "target_card": game.target_card,
+                "current_player": game.current_player,
+                "players": players,
+                "current_round": [{"player": entry["player"], "num_cards": len(entry["cards"])}
+                                  for entry in game.current_round],
+                "logs": game.get_game_logs(debug),
+                "challenge_info": game.get_challenge_info(),
+                "thinking": thinking,
+                "winner": game.get_winner() if over else None,
+            }
+
+    def wait_for_change(self, table_id, version, timeout=None):
+        """阻塞等待牌桌的版本号与 version 不同，返回最新的版本号；超时返回当前版本号"""
+        table = self.get_table(table_id)
+        with table.lock:
+            table.changed.wait_for(lambda: table.version != version, timeout)
+            return table.version
+
+    def _schedule(self, table):
+        self.loop.call_soon_threadsafe(self._ensure_turns, table)
+
+    def _ensure_turns(self, table):
+        """在事件循环中调用：轮到AI玩家且没有正在推进的任务时创建任务"""
+        if table.task is not None and not table.task.done():
+            return
+        if table.status == "thinking" and self.tables.get(table.id) is table:
+            table.task = self.loop.create_task(self._run_turns(table))
+
+    async def _run_turns(self, table):
+        """连续推进AI回合，直到轮到用户或者游戏结束。质疑之后的暂停期间，下一个AI玩家已经开始思考：
+        出牌后游戏状态已经确定，只有这个任务会推进AI回合，提前开始的决策不会失效"""
+        game = table.game
+
+        def on_stream(parser):
+            table.stream = parser
+
+        def think():
+            return self.loop.create_task(
+                game.aplayer_think(self.max_retry, self.timeout, self.semaphore, self.executor, on_stream))
+
+        pending = None
+        try:
+            while table.status == "thinking":
+                try:
+                    task, pending = pending or think(), None
+                    action, cards, thought, dialog = await task
+                    # 页面渲染时会持有牌桌锁，在默认线程池中加锁出牌，避免阻塞所有牌桌共用的事件循环
+                    await self.loop.run_in_executor(None, self._apply_turn, table, action, cards, thought, dialog)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    TABLE_ERRORS.inc()
+                    await self.loop.run_in_executor(None, self._set_error, table, f"{type(e).__name__}: {e}")
+                    return
+                TABLE_TURNS.inc(action=action)
+                if action == game.action_space[1] and table.challenge_pause:
+                    if table.status == "thinking":
+                        pending = think()
+                    await asyncio.sleep(table.challenge_pause)
+        finally:
+            # 牌桌关闭时取消提前开始的决策
+            if pending is not None:
+                pending.cancel()
+
+    @staticmethod
+    def _apply_turn(table, action, cards, thought, dialog):
+        with table.lock, metrics.timer(metrics.PLAY_SECONDS, action=action):
+            table.game.play(action, cards, thought, dialog)
+            table._bump()
+
+    @staticmethod
+    def _set_error(table, error):
+        with table.lock:
+            table.error = error
+            table._bump()
+
+    async def _sweep_idle(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            now = time.monotonic()
+            for table_id, table in list(self.tables.items()):
+                if now - table.last_active > self.idle_timeout:
+                    self.close_table(table_id)
+
+    def shutdown(self):
+        """取消所有AI回合并停止事件循环"""
+        for table_id in list(self.tables):
+            self.close_table(table_id)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _TableHandler(BaseHTTPRequestHandler):
+    manager = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "tables":
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        try:
+            # 带上 version 参数时长轮询：等到状态变化或者超时再返回
+            if "version" in query:
+                self.manager.wait_for_change(parts[1], int(query["version"][0]),
+                                             float(query.get("wait", ["30"])[0]))
+            debug = query.get("debug", ["0"])[0] in ("1", "true")
+            self._send_json(200, self.manager.snapshot(parts[1], debug))
+        except TableError as e:
+            self._send_json(404, {"error": str(e)})
+
+    def do_POST(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        try:
+            payload = self._read_json()
+            if parts == ["tables"]:
+                table_id = self.manager.create_table(payload["styles"],
+                                                     payload.get("model_config_name", "aistudio"),
+                                                     payload.get("seed"), payload.get("compact_rules", False),
+                                                     probability_hint=payload.get("probability_hint", False))
+                self._send_json(201, {"table_id": table_id})
+            elif len(parts) == 3 and parts[0] == "tables" and parts[2] == "action":
+                version = self.manager.submit_action(parts[1], payload["action"], payload.get("cards"),
+                                                     payload.get("thought"), payload.get("dialog"))
+                self._send_json(200, {"version": version})
+            else:
+                self.send_error(404)
+        except (TableError, KeyError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+
+    def do_DELETE(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "tables":
+            self.send_error(404)
+            return
+        self.manager.close_table(parts[1])
+        self._send_json(200, {"table_id": parts[1]})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(manager, port=9200, addr="127.0.0.1"):
+    """在后台线程中启动牌桌的 JSON 接口：
+
+    - POST /tables 创建牌桌，请求体为 {"styles": [...], "model_config_name": "...", "seed": 1}
+    - GET /tables/<id>?version=<n>&wait=<秒>&debug=1 读取快照，带 version 时长轮询等待状态变化
+    - POST /tables/<id>/action 提交用户行动，请求体为 {"action": "trust", "cards": ["Q"]}
+    - DELETE /tables/<id> 关闭牌桌
+    """
+    handler = type("TableHandler", (_TableHandler,), {"manager": manager})
+    server = ThreadingHTTPServer((addr, port), handler)
+    threading.Thread(target=server.serve_forever, name="table-server", daemon=True).start()
+    return server
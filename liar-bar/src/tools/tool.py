@@ -1,8 +1,7 @@
 # Copyright (c) 2024 King Jingxiang
 # See the LICENSE file for license rights and limitations (MIT).
 import random
-import time
-from typing import List
+from typing import List, Optional, Tuple
 
 from agentscope.service import (
     ServiceResponse,
@@ -10,15 +9,23 @@ from agentscope.service import (
 )
 
 
-def execute_divination(cards: List[str], target_card: str) -> ServiceResponse:
+def divine(cards: List[str], target_card: str,
+           rng: Optional[random.Random] = None) -> Tuple[bool, Optional[bool], Optional[int]]:
     """
-    执行占卜函数，根据传入的卡牌序列决定出牌或质疑，并返回占卜结果。
+    占卜：根据手牌随机决定出牌或质疑。
 
     Args:
         cards (List[str]): 玩家手中的卡牌序列，例如 ['A', 'A', 'K', 'K', 'Joker']
         target_card (str): 本轮目标牌, 例如: 'K'
+        rng (random.Random): 随机数生成器，默认使用一个新的随机数生成器
+
+    Returns:
+        Tuple[bool, Optional[bool], Optional[int]]: (是否出牌, 是否出真牌, 出牌数量)，质疑时后两项为None
     """
-    random.seed(time.time())
+    rng = rng or random.Random()
+    # 手牌已经出完时只能质疑
+    if not cards:
+        return False, None, None
     # 计算真牌和假牌的数量
     true_cards = [card for card in cards if card == target_card or card.lower() == 'joker']
     num_true_cards = len(true_cards)
@@ -26,31 +33,41 @@ def execute_divination(cards: List[str], target_card: str) -> ServiceResponse:
 
     # 随机决定出牌或质疑
     actions = ['出牌', '质疑']
-    action = random.choice(actions)
+    action = rng.choice(actions)
+    if action != '出牌':
+        return False, None, None
 
     # 如果决定出牌，再随机决定出真牌或假牌
-    if action == '出牌':
-        if num_true_cards > 0 and num_false_cards > 0:
-            # 如果既有真牌也有假牌，随机选择
-            is_true_card = random.choice([True, False])
-        elif num_true_cards > 0:
-            # 只有真牌
-            is_true_card = True
-        else:
-            # 只有假牌
-            is_true_card = False
-
-        # 随机决定出牌数量
-        if is_true_card:
-            number_of_cards = random.randint(1, min(3, num_true_cards))
-        else:
-            number_of_cards = random.randint(1, min(3, num_false_cards))
+    if num_true_cards > 0 and num_false_cards > 0:
+        # 如果既有真牌也有假牌，随机选择
+        is_true_card = rng.choice([True, False])
+    elif num_true_cards > 0:
+        # 只有真牌
+        is_true_card = True
+    else:
+        # 只有假牌
+        is_true_card = False
+
+    # 随机决定出牌数量
+    if is_true_card:
+        number_of_cards = rng.randint(1, min(3, num_true_cards))
     else:
-        is_true_card = None
-        number_of_cards = None
+        number_of_cards = rng.randint(1, min(3, num_false_cards))
+    return True, is_true_card, number_of_cards
+
+
+def execute_divination(cards: List[str], target_card: str, rng: Optional[random.Random] = None) -> ServiceResponse:
+    """
+    执行占卜函数，根据传入的卡牌序列决定出牌或质疑，并返回占卜结果。
 
-    result = f"本轮占卜结果: 选择{action}"
-    if action == '出牌':
+    Args:
+        cards (List[str]): 玩家手中的卡牌序列，例如 ['A', 'A', 'K', 'K', 'Joker']
+        target_card (str): 本轮目标牌, 例如: 'K'
+        rng (random.Random): 随机数生成器，默认使用一个新的随机数生成器
+    """
+    play, is_true_card, number_of_cards = divine(cards, target_card, rng)
+    result = f"本轮占卜结果: 选择{'出牌' if play else '质疑'}"
+    if play:
         result += f", 出{number_of_cards}张{('真' if is_true_card else '假')}牌。"
 
     return ServiceResponse(status=ServiceExecStatus.SUCCESS, content=result)